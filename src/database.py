@@ -1,11 +1,56 @@
 import psycopg2 
 import pandas as pd
 from dotenv import load_dotenv
+from collections import OrderedDict
+import contextlib
+import threading
+import hashlib
+import pickle
+import time
+import re
 import os
 import sys
 
 load_dotenv()
 
+# Query result cache settings, the cache is off unless DB_CACHE is set
+CACHE_ENABLED = os.getenv('DB_CACHE', '0').lower() in ('1', 'true', 'yes')
+CACHE_DIR = os.getenv('DB_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.db_cache'))
+CACHE_SIZE = int(os.getenv('DB_CACHE_SIZE', '256'))
+CACHE_TTL = int(os.getenv('DB_CACHE_TTL', '3600'))
+
+# Per-table write counters, kept in the DB so writes from any host invalidate every cache
+VERSIONS_TABLE = 'd_table_versions'
+
+# Whether the counters table has been seen, and whether reading it has failed
+# in this process. After a failure the cache stays off rather than retrying
+_versions_table_exists = False
+_versions_read_failed = False
+
+# In-process LRU, maps cache key -> (created time, table versions, df)
+# Shared by every thread, so only touched while holding _memory_lock
+_memory_cache = OrderedDict()
+_memory_lock = threading.Lock()
+
+# Financial statement tables for each reporting period
+STATEMENT_TABLES = {
+    "annual": {
+        "income": "f_income_stmts_annual",
+        "balance": "f_balance_sheets_annual",
+        "cash": "f_cashflow_annual",
+    },
+    "quarterly": {
+        "income": "f_income_stmts_quarterly",
+        "balance": "f_balance_sheets_quarterly",
+        "cash": "f_cashflow_quarterly",
+    },
+    "ttm": {
+        "income": "f_income_stmts_ttm",
+        "balance": "f_balance_sheets_ttm",
+        "cash": "f_cashflow_ttm",
+    },
+}
+
 def connect_db():
     """
     Connect to the PostgreSQL database 
@@ -29,15 +74,209 @@ def connect_db():
     return conn
 
 
-def postgres_to_df(conn, query, column_names):
+def normalize_query(query):
+    """
+    Collapse whitespace in a query so formatting changes
+    don't produce different cache keys
+    """
+    return ' '.join(query.split()).rstrip(';').strip()
+
+
+def query_tables(query):
+    """
+    Return a sorted list of the tables read by a SELECT query
+    """
+    tables = re.findall(r'\b(?:FROM|JOIN)\s+([A-Za-z_][A-Za-z0-9_]*)', query, flags=re.IGNORECASE)
+    return sorted(set(table.lower() for table in tables))
+
+
+def ensure_versions_table(cursor):
+    """
+    Create the table version counters table if it doesn't exist yet
+    """
+    cursor.execute(f"""CREATE TABLE IF NOT EXISTS {VERSIONS_TABLE} (
+                            table_name VARCHAR(64) PRIMARY KEY,
+                            version BIGINT NOT NULL DEFAULT 0);""")
+
+
+def get_table_versions(conn):
+    """
+    Read every table's version counter in one query
+    Tables that have never been written to are at version 0, as is every
+    table before the first write has created the counters table
+    Returns None if the counters can't be read, in which case nothing
+    should be served from the cache. The read isn't retried after that
+    """
+    global _versions_table_exists, _versions_read_failed
+    if _versions_read_failed:
+        return None
+
+    # The savepoint lets a failed read be undone without rolling back the caller's transaction
+    savepoint = "" if conn.autocommit else "SAVEPOINT table_versions; "
+    cursor = conn.cursor()
+    try:
+        if not _versions_table_exists:
+            cursor.execute(f"{savepoint}SELECT to_regclass(%s) IS NOT NULL;", (VERSIONS_TABLE,))
+            savepoint = ""
+            if not cursor.fetchone()[0]:
+                cursor.close()
+                return {}
+            _versions_table_exists = True
+
+        cursor.execute(f"{savepoint}SELECT table_name, version FROM {VERSIONS_TABLE};")
+        versions = dict(cursor.fetchall())
+    except (Exception, psycopg2.DatabaseError) as e:
+        print(f"Error reading table versions, not using the query cache: {e}")
+        _versions_read_failed = True
+        if not conn.autocommit:
+            with contextlib.suppress(Exception):
+                cursor.execute("ROLLBACK TO SAVEPOINT table_versions;")
+        cursor.close()
+        return None
+
+    cursor.close()
+    return versions
+
+
+def bump_table_version(cursor, table):
+    """
+    Increment the version counter for a table
+    Called by the write paths with their own cursor before they commit, so
+    the bump lands in the same transaction as the data. Any cached query
+    results that read the table are no longer served after the commit
+    """
+    ensure_versions_table(cursor)
+    cursor.execute(f"""INSERT INTO {VERSIONS_TABLE} (table_name, version) VALUES (%s, 1)
+                       ON CONFLICT (table_name) DO UPDATE SET version = {VERSIONS_TABLE}.version + 1;""", (table,))
+
+
+def clear_cache():
+    """
+    Remove every cached query result, in memory and on disk
+    """
+    with _memory_lock:
+        _memory_cache.clear()
+    if not os.path.isdir(CACHE_DIR):
+        return
+    for name in os.listdir(CACHE_DIR):
+        if name.endswith('.pkl'):
+            _remove_file(os.path.join(CACHE_DIR, name))
+
+
+def _remove_file(path):
+    """
+    Remove a cache file, other processes sharing CACHE_DIR may have removed it first
+    """
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(path)
+
+
+def _cache_key(query, params, column_names):
+    key = repr((normalize_query(query), params, list(column_names)))
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def _cache_get(key, versions):
+    """
+    Look up a cached df, first in memory and then on disk
+    Entries past their TTL or read from a table that has since been
+    written to are dropped and None is returned
+    """
+    with _memory_lock:
+        entry = _memory_cache.get(key)
+    path = os.path.join(CACHE_DIR, f"{key}.pkl")
+
+    if entry is None:
+        try:
+            with open(path, 'rb') as f:
+                entry = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+
+    created, entry_versions, df = entry
+    if time.time() - created > CACHE_TTL or entry_versions != versions:
+        with _memory_lock:
+            _memory_cache.pop(key, None)
+        _remove_file(path)
+        return None
+
+    # Mark as most recently used
+    _memory_store(key, entry)
+    return df.copy()
+
+
+def _cache_put(key, versions, df):
+    entry = (time.time(), versions, df.copy())
+    _memory_store(key, entry)
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = os.path.join(CACHE_DIR, f"{key}.pkl")
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+    _evict_disk()
+
+
+def _memory_store(key, entry):
+    """
+    Store an entry as the most recently used, evicting the least
+    recently used ones past CACHE_SIZE
+    """
+    with _memory_lock:
+        _memory_cache[key] = entry
+        _memory_cache.move_to_end(key)
+        while len(_memory_cache) > CACHE_SIZE:
+            _memory_cache.popitem(last=False)
+
+
+def _evict_disk():
+    """
+    Keep at most CACHE_SIZE result files on disk, dropping the
+    least recently modified first
+    """
+    files = [os.path.join(CACHE_DIR, name) for name in os.listdir(CACHE_DIR) if name.endswith('.pkl')]
+    if len(files) <= CACHE_SIZE:
+        return
+
+    # Files removed by another process while listing are skipped
+    mtimes = []
+    for path in files:
+        with contextlib.suppress(FileNotFoundError):
+            mtimes.append((os.path.getmtime(path), path))
+    mtimes.sort()
+    for _, path in mtimes[:len(mtimes) - CACHE_SIZE]:
+        _remove_file(path)
+
+
+def postgres_to_df(conn, query, column_names, params=None, cache=None, versions=None):
     """
     Transform result of a SELECT query into a pandas
     dataframe, and return resultant df
+    If cache is True (defaults to the DB_CACHE env setting), results are
+    served from the query cache while the tables read are unchanged
+    versions can be passed in from get_table_versions, so several queries
+    share one read of the counters, otherwise they are read here
     """
+    if cache is None:
+        cache = CACHE_ENABLED
+
+    if cache and versions is None:
+        versions = get_table_versions(conn)
+    if versions is None:
+        cache = False
+
+    if cache:
+        versions = {table: versions.get(table, 0) for table in query_tables(query)}
+        key = _cache_key(query, params, column_names)
+        df = _cache_get(key, versions)
+        if df is not None:
+            return df
+
     cursor = conn.cursor()
 
     try:
-        cursor.execute(query)
+        cursor.execute(query, params)
     
     except (Exception, psycopg2.DatabaseError) as e:
         print(f"Error performing query: {e}")
@@ -50,6 +289,9 @@ def postgres_to_df(conn, query, column_names):
 
     # Now turn tuples into pandas DF
     df = pd.DataFrame(tuples, columns=column_names)
+
+    if cache:
+        _cache_put(key, versions, df)
     return df
 
 
@@ -0,0 +1,295 @@
+import database as db
+import pandas as pd
+import numpy as np
+import psycopg2
+import models
+import utils
+import validation
+import click
+
+# pyarrow is only needed for the parquet and arrow formats
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Fundamentals exported from each statement, the columns the registered
+# models need are added to these in fundamental_columns
+BASE_COLUMNS = {
+    "income": ["shares_basic", "revenue", "net_income", "gross_profit", "operating_expenses",
+               "income_tax_benefit_net", "pretax_income_loss", "operating_income_loss"],
+    "balance": ["total_equity", "long_term_debt", "short_term_debt"],
+    "cash": ["net_cash_operating_activities", "dividends_paid"],
+}
+
+
+def fundamental_columns():
+    '''
+    Returns a dict of statement -> BASE_COLUMNS plus the columns any registered model needs
+    '''
+    columns = {statement: list(cols) for statement, cols in BASE_COLUMNS.items()}
+    for statement, cols in models.required_columns(models.MODELS.values()).items():
+        columns[statement].extend(col for col in cols if col not in columns[statement])
+    return columns
+
+
+STATEMENT_COLUMNS = fundamental_columns()
+ALIASES = {"income": "i", "balance": "b", "cash": "c"}
+
+EXPORT_QUERY = f"""SELECT
+                        i.ticker,
+                        i.report_date,
+                        {", ".join(f"{ALIASES[statement]}.{col}" for statement, cols in STATEMENT_COLUMNS.items() for col in cols)}
+                    FROM
+                        f_income_stmts_annual i
+                    JOIN f_balance_sheets_annual b
+                        ON b.ticker = i.ticker AND b.report_date = i.report_date
+                    JOIN f_cashflow_annual c
+                        ON c.ticker = i.ticker AND c.report_date = i.report_date
+                    {{where}}
+                    ORDER BY
+                        i.ticker, i.report_date;"""
+
+FUNDAMENTAL_COLUMNS = ["ticker", "report_date"] + [col for cols in STATEMENT_COLUMNS.values() for col in cols]
+
+# Columns growth rates are calculated for, and the prefix used in the output
+GROWTH_COLUMNS = {
+    "revenue": "revenue",
+    "net_income": "net_income",
+    "total_equity": "equity",
+    "net_cash_operating_activities": "op_cash",
+}
+GROWTH_PERIODS = ["1yr", "3yr", "5yr", "max"]
+
+MODEL_COLUMNS = [col for model in models.MODELS.values() for col in model.outputs]
+
+DERIVED_COLUMNS = ["eps", "sales_per_share", "equity_per_share", "op_cash_per_share"] + \
+                  [f"{name}_growth_{period}" for name in GROWTH_COLUMNS.values() for period in GROWTH_PERIODS] + \
+                  MODEL_COLUMNS
+
+EXPORT_COLUMNS = FUNDAMENTAL_COLUMNS + DERIVED_COLUMNS
+
+
+def derive_metrics(df):
+    '''
+    This function takes a batch of joined fundamentals, sorted by ticker and
+    report date, holding the full history of every ticker in the batch
+    Adds per share values and growth rates for each row, as of that report date,
+    and the results of every registered valuation model. Models value a ticker
+    as of its latest report, so their columns are only filled on that row, and
+    are left empty for tickers that fail the checks in models.compute_models
+    Returns a tuple of (df, df of rejected tickers, models and reasons)
+    '''
+    df = df.copy()
+    numeric = FUNDAMENTAL_COLUMNS[2:]
+    df[numeric] = df[numeric].astype(np.float64)
+
+    # Replace NaN in dividends column with zero
+    df["dividends_paid"] = df["dividends_paid"].fillna(0)
+
+    df["eps"] = (df["net_income"] + df["dividends_paid"]).div(df["shares_basic"])
+    df[["sales_per_share", "equity_per_share", "op_cash_per_share"]] = df[["revenue", "total_equity", "net_cash_operating_activities"]].div(df["shares_basic"], axis=0)
+
+    growth_dfs = [utils.growth_by_ticker(df, col, name) for col, name in GROWTH_COLUMNS.items()]
+    df = pd.concat([df] + growth_dfs, axis=1)
+
+    # The statements are inner joined, so every statement has each report date
+    checked_df = df.assign(**{col: df["report_date"] for col in validation.DATE_COLUMNS.values()})
+    results, rejects = models.compute_models(checked_df, models.MODELS.values())
+
+    # Model results are indexed by ticker, line them up with each ticker's latest row
+    last = df.groupby("ticker", sort=False).tail(1).index
+    results = results.reindex(index=df.loc[last, "ticker"], columns=MODEL_COLUMNS)
+    model_df = pd.DataFrame(np.nan, index=df.index, columns=MODEL_COLUMNS)
+    model_df.loc[last] = results.to_numpy()
+
+    return pd.concat([df, model_df], axis=1), rejects
+
+
+def stream_batches(conn, query, params, batch_size):
+    '''
+    Generator that reads the query result through a server-side cursor,
+    batch_size rows at a time
+    The rows of the last ticker in each batch are held back until the next one,
+    so every yielded df contains complete ticker histories
+    '''
+    cursor = conn.cursor(name="benthos_export")
+    cursor.itersize = batch_size
+    cursor.execute(query, params)
+
+    pending = None
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+
+        df = pd.DataFrame(rows, columns=FUNDAMENTAL_COLUMNS)
+        if pending is not None:
+            df = pd.concat([pending, df], ignore_index=True)
+
+        # Hold back the last ticker, its history may continue in the next batch
+        complete = df["ticker"] != df["ticker"].iloc[-1]
+        pending = df[~complete]
+        if complete.any():
+            yield df[complete]
+
+    if pending is not None and not pending.empty:
+        yield pending
+
+    cursor.close()
+
+
+class CsvWriter:
+    '''
+    Appends each batch to a CSV file, writing the header once
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.header = True
+
+    def write(self, df):
+        df.to_csv(self.path, mode="w" if self.header else "a", header=self.header, index=False)
+        self.header = False
+
+    def close(self):
+        pass
+
+
+class ParquetWriter:
+    '''
+    Writes each batch as a row group of a single parquet file
+    The schema is taken from the first batch
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.writer = None
+        self.schema = None
+
+    def write(self, df):
+        if self.writer is None:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            self.schema = table.schema
+            self.writer = pq.ParquetWriter(self.path, self.schema)
+        else:
+            table = pa.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+class ArrowWriter:
+    '''
+    Writes each batch as a record batch of an Arrow IPC (feather v2) file
+    The schema is taken from the first batch
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.writer = None
+        self.schema = None
+
+    def write(self, df):
+        if self.writer is None:
+            batch = pa.RecordBatch.from_pandas(df, preserve_index=False)
+            self.schema = batch.schema
+            self.writer = pa.ipc.new_file(self.path, self.schema)
+        else:
+            batch = pa.RecordBatch.from_pandas(df, schema=self.schema, preserve_index=False)
+        self.writer.write_batch(batch)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+WRITERS = {
+    "csv": CsvWriter,
+    "parquet": ParquetWriter,
+    "arrow": ArrowWriter,
+}
+
+
+@click.command()
+@click.option('--output', required=True, help='Path of the file to export to')
+@click.option('--format', 'file_format', type=click.Choice(list(WRITERS)), default='parquet', help='Output file format')
+@click.option('--columns', default=None, help='Comma-separated list of columns to export (default all)')
+@click.option('--tickers', default=None, help='Comma-separated list of tickers to export (default all)')
+@click.option('--start-date', type=click.DateTime(formats=["%Y-%m-%d"]), default=None, help='Only export report dates on or after this date')
+@click.option('--end-date', type=click.DateTime(formats=["%Y-%m-%d"]), default=None, help='Only export report dates on or before this date')
+@click.option('--batch-size', default=10000, help='Number of rows fetched from the DB per batch')
+@click.option('--rejects', 'rejects_output', default=None, help='Optional CSV path to save the rejected tickers and reasons to')
+def export(output, file_format, columns, tickers, start_date, end_date, batch_size, rejects_output):
+    '''
+    Export the joined fundamentals, computed growth metrics and valuation
+    model results for every ticker to a file, streaming in batches
+    '''
+    if file_format != "csv" and pa is None:
+        print(f"pyarrow is required for the {file_format} format. Install it or use --format csv.")
+        return 1
+
+    if columns is not None:
+        columns = [col.strip() for col in columns.split(",")]
+        unknown = [col for col in columns if col not in EXPORT_COLUMNS]
+        if unknown:
+            print(f"Unknown export columns: {', '.join(unknown)}. Available columns: {', '.join(EXPORT_COLUMNS)}")
+            return 1
+    else:
+        columns = EXPORT_COLUMNS
+
+    # The start date is applied after the calculations, since growth rates need the earlier history
+    conditions = []
+    params = []
+    if tickers is not None:
+        conditions.append("i.ticker = ANY(%s)")
+        params.append([ticker.strip() for ticker in tickers.split(",")])
+    if end_date is not None:
+        conditions.append("i.report_date <= %s")
+        params.append(end_date.date())
+
+    where = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+    query = EXPORT_QUERY.format(where=where)
+
+    conn = db.connect_db()
+    writer = WRITERS[file_format](output)
+    n_rows = 0
+    rejects = []
+
+    try:
+        for batch in stream_batches(conn, query, params, batch_size):
+            batch, batch_rejects = derive_metrics(batch)
+            rejects.append(batch_rejects)
+
+            if start_date is not None:
+                batch = batch[pd.to_datetime(batch["report_date"]) >= start_date]
+            if batch.empty:
+                continue
+
+            writer.write(batch[columns])
+            n_rows += len(batch.index)
+
+    except (Exception, psycopg2.DatabaseError) as e:
+        print(f"Error exporting data: {e}")
+        return 1
+
+    finally:
+        writer.close()
+        conn.close()
+
+    print(f"Exported {n_rows} rows to {output}.")
+
+    rejects = pd.concat(rejects, ignore_index=True) if rejects else pd.DataFrame(columns=["ticker", "model", "reasons"])
+    if not rejects.empty:
+        print(f"Left the model results empty for {rejects['ticker'].nunique()} ticker(s) that failed data quality checks.")
+
+    if rejects_output is not None:
+        rejects.to_csv(rejects_output, index=False)
+        print(f"Rejected tickers saved to {rejects_output}")
+
+
+if __name__ == "__main__":
+    export()
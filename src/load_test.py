@@ -0,0 +1,268 @@
+import database as db
+import main
+import pandas as pd
+import numpy as np
+import psycopg2
+from psycopg2.extras import execute_values
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from contextlib import redirect_stdout
+from datetime import date
+import threading
+import click
+import time
+import sys
+import os
+
+# Synthetic tickers look like ZZLT-0001, which no exchange symbol can match,
+# and cleanup only removes tickers matching that exact pattern
+TICKER_PREFIX = "ZZLT-"
+TICKER_PATTERN = r"^ZZLT-[0-9]{4}$"
+LOCAL_HOSTS = ["localhost", "127.0.0.1", "::1"]
+
+# Only the columns read by the valuation path are created and seeded
+CREATE_TABLES = [
+    """CREATE TABLE IF NOT EXISTS f_income_stmts_annual (
+            ticker VARCHAR(12),
+            fiscal_year INTEGER,
+            report_date DATE,
+            shares_basic BIGINT,
+            revenue BIGINT,
+            net_income BIGINT,
+            gross_profit BIGINT,
+            operating_expenses BIGINT,
+            income_tax_benefit_net BIGINT,
+            pretax_income_loss BIGINT,
+            operating_income_loss BIGINT);""",
+    """CREATE TABLE IF NOT EXISTS f_balance_sheets_annual (
+            ticker VARCHAR(12),
+            report_date DATE,
+            total_equity BIGINT,
+            long_term_debt BIGINT,
+            short_term_debt BIGINT);""",
+    """CREATE TABLE IF NOT EXISTS f_cashflow_annual (
+            ticker VARCHAR(12),
+            report_date DATE,
+            net_cash_operating_activities BIGINT,
+            dividends_paid BIGINT);""",
+]
+
+
+def synthetic_fundamentals(n_tickers, n_years, seed=None):
+    '''
+    This function builds random but plausible annual fundamentals
+    for n_tickers, each with n_years of history ending last year
+    Returns a dict of table name -> list of row tuples
+    '''
+    rng = np.random.default_rng(seed)
+    last_year = date.today().year - 1
+    rows = {"f_income_stmts_annual": [], "f_balance_sheets_annual": [], "f_cashflow_annual": []}
+
+    for i in range(n_tickers):
+        ticker = f"{TICKER_PREFIX}{i:04d}"
+        growth = 1 + rng.uniform(0.02, 0.20)
+        revenue = rng.uniform(1e8, 5e10)
+        shares = int(rng.uniform(1e7, 5e9))
+        equity = revenue * rng.uniform(0.3, 1.5)
+
+        for n in range(n_years):
+            year = last_year - n_years + 1 + n
+            report_date = date(year, 12, 31)
+            scale = growth ** n * rng.uniform(0.95, 1.05)
+            rev = int(revenue * scale)
+            gross = int(rev * 0.4)
+            op_exp = -int(rev * 0.2)
+            op_income = gross + op_exp
+            pretax = int(op_income * 0.95)
+            tax = -int(pretax * 0.21)
+            net_income = pretax + tax
+
+            rows["f_income_stmts_annual"].append((ticker, year, report_date, shares, rev, net_income, gross, op_exp, tax, pretax, op_income))
+            rows["f_balance_sheets_annual"].append((ticker, report_date, int(equity * scale), int(rev * 0.3), int(rev * 0.05)))
+            rows["f_cashflow_annual"].append((ticker, report_date, int(net_income * 1.2), -int(net_income * 0.3)))
+
+    return rows
+
+
+def seed_db(conn, n_tickers, n_years, seed=None):
+    '''
+    Create the fundamentals tables if they don't exist, remove old
+    synthetic tickers and insert a fresh set
+    Returns the list of seeded tickers
+    '''
+    rows = synthetic_fundamentals(n_tickers, n_years, seed)
+    cursor = conn.cursor()
+
+    try:
+        for query in CREATE_TABLES:
+            cursor.execute(query)
+
+        for table_name, tuples in rows.items():
+            cursor.execute(f"DELETE FROM {table_name} WHERE ticker ~ %s;", (TICKER_PATTERN,))
+
+        execute_values(cursor, """INSERT INTO f_income_stmts_annual (ticker, fiscal_year, report_date, shares_basic, revenue, net_income, gross_profit,
+                                    operating_expenses, income_tax_benefit_net, pretax_income_loss, operating_income_loss) VALUES %s""", rows["f_income_stmts_annual"])
+        execute_values(cursor, """INSERT INTO f_balance_sheets_annual (ticker, report_date, total_equity, long_term_debt, short_term_debt)
+                                    VALUES %s""", rows["f_balance_sheets_annual"])
+        execute_values(cursor, """INSERT INTO f_cashflow_annual (ticker, report_date, net_cash_operating_activities, dividends_paid)
+                                    VALUES %s""", rows["f_cashflow_annual"])
+        for table_name in rows:
+            db.bump_table_version(cursor, table_name)
+        conn.commit()
+    except (Exception, psycopg2.DatabaseError) as e:
+        print(f"Error seeding load test data: {e}")
+        conn.rollback()
+        cursor.close()
+        return None
+
+    cursor.close()
+
+    return [f"{TICKER_PREFIX}{i:04d}" for i in range(n_tickers)]
+
+
+def run_valuation(ticker):
+    '''
+    Run one full valuation for ticker, the same path as `main.py --ticker`
+    Returns a tuple of (latency in seconds, success flag)
+    '''
+    t0 = time.perf_counter()
+    try:
+        result = main.start.callback(ticker=ticker, viz=False, scenarios=0, seed=None, period="annual",
+                                     grid_growth=None, grid_pe=None, grid_years="10", grid_returns="15")
+        ok = "error_msg" not in result
+    except Exception:
+        ok = False
+    return time.perf_counter() - t0, ok
+
+
+def _quiet_worker():
+    # Process pool initializer, silence the prints in the valuation path
+    sys.stdout = open(os.devnull, "w")
+
+
+class ConnectionMonitor(threading.Thread):
+    '''
+    Background thread that samples the number of connections to
+    the database from pg_stat_activity while a load level runs
+    '''
+
+    def __init__(self, interval=0.05):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.samples = []
+        self._stop_event = threading.Event()
+
+    def run(self):
+        conn = db.connect_db()
+        cursor = conn.cursor()
+        while not self._stop_event.is_set():
+            cursor.execute("SELECT count(*) FROM pg_stat_activity WHERE datname = current_database();")
+            # Don't count the monitor's own connection
+            self.samples.append(cursor.fetchone()[0] - 1)
+            self._stop_event.wait(self.interval)
+        cursor.close()
+        conn.close()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def run_level(mode, concurrency, tickers, n_requests):
+    '''
+    Drive n_requests valuations over the tickers with the given
+    concurrency, using a thread or process pool
+    Returns a dict of throughput, latency percentiles and connection counts
+    '''
+    work = [tickers[i % len(tickers)] for i in range(n_requests)]
+
+    monitor = ConnectionMonitor()
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        monitor.start()
+        t0 = time.perf_counter()
+
+        if mode == "thread":
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                results = list(pool.map(run_valuation, work))
+        else:
+            with ProcessPoolExecutor(max_workers=concurrency, initializer=_quiet_worker) as pool:
+                results = list(pool.map(run_valuation, work))
+
+        elapsed = time.perf_counter() - t0
+        monitor.stop()
+
+    latencies = np.array([latency for latency, ok in results]) * 1000
+    errors = sum(1 for _, ok in results if not ok)
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    conns = monitor.samples or [0]
+
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "requests": n_requests,
+        "errors": errors,
+        "throughput": round(n_requests / elapsed, 2),
+        "p50_ms": round(p50, 1),
+        "p95_ms": round(p95, 1),
+        "p99_ms": round(p99, 1),
+        "max_conns": int(max(conns)),
+        "mean_conns": round(float(np.mean(conns)), 1),
+    }
+
+
+@click.command()
+@click.option('--host', default='localhost', help='Host of the local Postgres DB to load test against')
+@click.option('--port', default='5432', help='Port of the local Postgres DB')
+@click.option('--user', default='postgres', help='DB user')
+@click.option('--password', default='', help='DB password')
+@click.option('--dbname', default='benthos_loadtest', help='DB name')
+@click.option('--seed/--no-seed', 'do_seed', default=True, help='Seed synthetic fundamentals before running')
+@click.option('--tickers', 'n_tickers', default=50, help='Number of synthetic tickers to seed')
+@click.option('--years', 'n_years', default=12, help='Years of history per synthetic ticker')
+@click.option('--requests', 'n_requests', default=200, help='Number of valuations run at each concurrency level')
+@click.option('--concurrency', default='1,2,4,8,16', help='Comma-separated concurrency levels')
+@click.option('--mode', type=click.Choice(['thread', 'process', 'both']), default='both', help='Run valuations in threads, processes or both')
+@click.option('--cache/--no-cache', default=False, help='Allow the query result cache during the run')
+@click.option('--output', default=None, help='Optional CSV path to save the results to, for comparing runs')
+def load_test(host, port, user, password, dbname, do_seed, n_tickers, n_years, n_requests, concurrency, mode, cache, output):
+    '''
+    Load test the valuation path against a local Postgres DB
+    Reports throughput, p50/p95/p99 latency and DB connection counts
+    at each concurrency level
+    '''
+    if host not in LOCAL_HOSTS:
+        print(f"Refusing to load test against non-local host {host}.")
+        return
+
+    # connect_db reads these at call time, and worker processes inherit them
+    os.environ.update({"DB_HOST": host, "DB_PORT": port, "DB_USER": user, "DB_PASSWORD": password, "DB_NAME": dbname, "DB_CACHE": "1" if cache else "0"})
+    db.CACHE_ENABLED = cache
+
+    if do_seed:
+        conn = db.connect_db()
+        tickers = seed_db(conn, n_tickers, n_years)
+        conn.close()
+        if tickers is None:
+            return
+        print(f"Seeded {len(tickers)} synthetic tickers with {n_years} years of data.")
+    else:
+        tickers = [f"{TICKER_PREFIX}{i:04d}" for i in range(n_tickers)]
+
+    modes = ["thread", "process"] if mode == "both" else [mode]
+    levels = [int(level) for level in concurrency.split(",")]
+
+    results = []
+    for m in modes:
+        for level in levels:
+            print(f"Running {n_requests} valuations, {m} pool, concurrency {level}...")
+            results.append(run_level(m, level, tickers, n_requests))
+
+    results_df = pd.DataFrame(results)
+    print(results_df.to_string(index=False))
+
+    if output is not None:
+        results_df.to_csv(output, index=False)
+        print(f"Results saved to {output}")
+
+
+if __name__ == "__main__":
+    load_test()
@@ -2,6 +2,10 @@ import database as db
 import pandas as pd
 import matplotlib.pyplot as plt
 import utils
+import sensitivity
+import ttm
+import validation
+import models
 import click
 
 pd.set_option('display.max_columns', 30)
@@ -10,17 +14,41 @@ pd.set_option('display.max_columns', 30)
 @click.command()
 @click.option('--ticker', prompt = 'Enter a ticker in uppercase', help='Ticker symbol used to calculate margin of safety price')
 @click.option('--viz/--no-viz', default=False, help='Display graphs or not')
-def start(ticker, viz):
+@click.option('--scenarios', default=0, help='Number of Monte Carlo scenarios to run for sticker price percentiles (0 to skip)')
+@click.option('--seed', default=None, type=int, help='Random seed for the Monte Carlo scenarios')
+@click.option('--period', type=click.Choice(['annual', 'ttm']), default='annual', help='Run on annual statements or trailing twelve month figures')
+@click.option('--grid-growth', default=None, help='Comma-separated growth rates (%) to show a sticker price grid for')
+@click.option('--grid-pe', default=None, help='Comma-separated PE ratios for the grid (default 2x each growth rate)')
+@click.option('--grid-years', default='10', help='Comma-separated numbers of years for the grid')
+@click.option('--grid-returns', default='15', help='Comma-separated required rates of return (%) for the grid')
+def start(ticker, viz, scenarios, seed, period, grid_growth, grid_pe, grid_years, grid_returns):
     '''
     This is the main function of the project
     Connects to Postgres DB
     Retrieves stock fundamental data and runs value cals
     '''
     STOCK = ticker
+    tables = db.STATEMENT_TABLES[period]
+
+    if grid_growth is not None:
+        try:
+            grid_growth = [float(rate) for rate in grid_growth.split(",")]
+            grid_pe = [float(pe) for pe in grid_pe.split(",")] if grid_pe is not None else None
+            grid_years = [int(years) for years in grid_years.split(",")]
+            grid_returns = [float(rate) for rate in grid_returns.split(",")]
+        except ValueError as e:
+            print(f"Invalid sticker price grid values: {e}")
+            return {
+                'ticker': STOCK,
+                'error_msg': f"Invalid sticker price grid values: {e}"
+            }
 
     # Connect to postgres db
     conn = db.connect_db()
 
+    # One read of the table version counters decides what the cache can serve
+    versions = db.get_table_versions(conn) if db.CACHE_ENABLED else None
+
     # Get income statement relevant columns for stock of interest
     income_stmt_query = f"""SELECT
                                 ticker,
@@ -35,7 +63,7 @@ def start(ticker, viz):
                                 operating_income_loss
 
                             FROM 
-                                f_income_stmts_annual
+                                {tables["income"]}
                             WHERE 
                                 ticker = '{STOCK}'
                             ORDER BY
@@ -43,33 +71,41 @@ def start(ticker, viz):
 
     income_df_columns = ["Ticker", "Date", "Shares", "Revenue", "Net Income", "Gross Profit", "Operating Expenses", "Income Tax", "Income Before Tax", "Operating Income"]
 
-    income_df = db.postgres_to_df(conn, income_stmt_query, income_df_columns)
+    income_df = db.postgres_to_df(conn, income_stmt_query, income_df_columns, versions=versions)
 
     # Get balance sheet columns
     balance_stmt_query = f"""SELECT
+                                report_date,
                                 total_equity,
                                 long_term_debt,
                                 short_term_debt
                             FROM 
-                                f_balance_sheets_annual b
+                                {tables["balance"]} b
                             WHERE 
                                 b.ticker = '{STOCK}'
                             ORDER BY report_date;"""
-    balance_df_cols = ["Total Equity", "Debt", "Short Term Debt"]
-    balance_df = db.postgres_to_df(conn, balance_stmt_query, balance_df_cols)
+    balance_df_cols = ["Balance Date", "Total Equity", "Debt", "Short Term Debt"]
+    balance_df = db.postgres_to_df(conn, balance_stmt_query, balance_df_cols, versions=versions)
 
     # Get cash flow stmt columns
     cashflow_stmt_query = f"""SELECT
+                                report_date,
                                 net_cash_operating_activities,
                                 dividends_paid
                             FROM 
-                                f_cashflow_annual c
+                                {tables["cash"]} c
                             WHERE 
                                 c.ticker = '{STOCK}'
                             ORDER BY
                                 report_date;"""
-    cashflow_df_cols = ["Net Cash from Operating Act", "Dividends Paid"]
-    cashflow_df = db.postgres_to_df(conn, cashflow_stmt_query, cashflow_df_cols)
+    cashflow_df_cols = ["Cash Date", "Net Cash from Operating Act", "Dividends Paid"]
+    cashflow_df = db.postgres_to_df(conn, cashflow_stmt_query, cashflow_df_cols, versions=versions)
+
+    # TTM figures are quarterly, keep one row per year back from the latest quarter
+    if period == "ttm":
+        income_df = ttm.to_annual_points(income_df)
+        balance_df = ttm.to_annual_points(balance_df)
+        cashflow_df = ttm.to_annual_points(cashflow_df)
 
     # Join 3 resultant dfs together 
     stock_df = pd.concat([income_df, balance_df, cashflow_df], axis=1, sort=False)
@@ -93,6 +129,17 @@ def start(ticker, viz):
         print(f"Sorry, we don't have data yet for {STOCK}. Try another stock.")
         return result
 
+    # Check the data is usable before running the growth and value calcs on it
+    _, rejects = validation.validate_fundamentals(validation.statements_frame(STOCK, income_df, balance_df, cashflow_df), models.MODELS["sticker"].positive_columns)
+    if not rejects.empty:
+        reasons = rejects.loc[rejects.index[0], "reasons"]
+        result = {
+            'ticker': STOCK,
+            'error_msg': f"Sorry, the data we have for {STOCK} can't be used: {reasons}."
+        }
+        print(f"Sorry, the data we have for {STOCK} can't be used: {reasons}.")
+        return result
+
     # Get incremental growth rates at 1 yr, 3yr, 5yr, max
     print(health_check_df[["Date", "Revenue", "Net Income", "Total Equity", "Net Cash from Operating Act"]])
     sales_growth = utils.compound_growth_rates(health_check_df, ["Revenue", "Sales Per Share"])
@@ -108,12 +155,6 @@ def start(ticker, viz):
     growth_df_raw_vals = growth_df[["Num Years Ago", "Revenue Growth", "Net Income Growth", "Total Equity Growth", "Net Cash from Operating Act Growth"]].copy()
     print(growth_df_raw_vals)
 
-    avg_equity_growth_rate = (growth_df["Total Equity Growth"].mean())
-    print("Equity Growth Rate", avg_equity_growth_rate)
-
-    default_PE = avg_equity_growth_rate * 2
-    print("Default PE Ratio", default_PE)
-
     year_now = int(health_check_df.loc[health_check_df.index[-1], "Date"].year)
     year_1_ago = int(health_check_df.loc[health_check_df.index[-2], "Date"].year)
     year_3_ago = int(health_check_df.loc[health_check_df.index[-4], "Date"].year)
@@ -220,32 +261,31 @@ def start(ticker, viz):
 
     # TODO Plot the incremental growth numbers
 
-    avg_equity_growth_rate = (growth_df["Total Equity Growth"].mean())
+    # Rule #1 sticker price, from the registered sticker model
+    model_df = pd.DataFrame({
+        "ticker": STOCK,
+        "report_date": stock_df["Date"],
+        "net_income": stock_df["Net Income"],
+        "shares_basic": stock_df["Shares"],
+        "total_equity": stock_df["Total Equity"],
+        "dividends_paid": stock_df["Dividends Paid"],
+    }).astype({"net_income": float, "shares_basic": float, "total_equity": float, "dividends_paid": float})
+    sticker_model = models.MODELS["sticker"]
+    valuation = sticker_model.compute(model_df).iloc[0]
+
+    avg_equity_growth_rate = valuation["equity_growth"]
     print("Equity Growth Rate", avg_equity_growth_rate)
+    print("Default PE Ratio", valuation["default_pe"])
 
-    default_PE = avg_equity_growth_rate * 2
-    print("Default PE Ratio", default_PE)
-
-    #FUTURE EPS
-    NI_now = income_df.loc[income_df.index[-1], "Net Income"]
-    shares_now = income_df.loc[income_df.index[-1], "Shares"]
-    
-    dividends_now = stock_df.loc[stock_df.index[-1], "Dividends Paid"]
-    EPS_current = (NI_now+dividends_now)/shares_now
+    EPS_current = valuation["current_eps"]
     print(stock_df["EPS"])
     print("Current EPS", EPS_current)
 
-    # Equity growth rate
-    print("Equity Growth Rate", avg_equity_growth_rate)
-    # calc: https://www.symbolab.com/solver/calculus-calculator/%5Cleft(%5Cfrac%7Bx%7D%7B17.5428%7D%5Cright)%5E%7B%5Cfrac%7B1%7D%7B10%7D%7D%20-1%20%3D%20.19
-    EPS_tenYrs_from_now = (((avg_equity_growth_rate/100)+1)**10) * EPS_current
-    print("EPS 10 yrs from now", EPS_tenYrs_from_now)
-
-    #Market Price
-    future_mkt_price = EPS_tenYrs_from_now * default_PE
-    print("Furture Market Price: ", future_mkt_price)
-    sticker_price = future_mkt_price/4.0456 #rule of 72 here taking into account the 15% min acceptable rate of return
-    MOS_sticker_price = sticker_price/2
+    print(f"EPS {sticker_model.years} yrs from now", valuation["future_eps"])
+    print("Furture Market Price: ", valuation["future_mkt_price"])
+
+    sticker_price = valuation["sticker_price"]
+    MOS_sticker_price = valuation["safety_price"]
     print("Stciker Price: ", sticker_price, "Margin of Safety Sticker Price: ", MOS_sticker_price)
 
     result = {
@@ -255,7 +295,21 @@ def start(ticker, viz):
         'equity_growth': round(avg_equity_growth_rate, 2)
     }
 
-
+    # Distribution of sticker prices over random growth, PE, horizon and required return
+    if scenarios > 0:
+        growth_std = growth_df["Total Equity Growth"].std()
+        sticker_dist, MOS_dist = sensitivity.monte_carlo(EPS_current, avg_equity_growth_rate, growth_std, n=scenarios, seed=seed)
+        result['sticker_price_percentiles'] = sensitivity.percentile_summary(sticker_dist)
+        result['safety_price_percentiles'] = sensitivity.percentile_summary(MOS_dist)
+        print("Sticker Price Percentiles: ", result['sticker_price_percentiles'])
+        print("Margin of Safety Price Percentiles: ", result['safety_price_percentiles'])
+
+    # Sticker prices over every combination of the given growth, PE, horizon and required return
+    if grid_growth is not None:
+        grid = sensitivity.grid_table(EPS_current, grid_growth, grid_pe, grid_years, grid_returns).round(2)
+        result['sticker_price_grid'] = grid.to_dict(orient="records")
+        print("Sticker Price Grid:")
+        print(grid.to_string(index=False))
 
     if viz:
         # Print raw numbers and per share values as a figure
@@ -0,0 +1,287 @@
+import database as db
+import pandas as pd
+import numpy as np
+import sensitivity
+import utils
+import validation
+import click
+
+# Registry of model name -> model instance, filled by the @register decorator
+MODELS = {}
+
+STATEMENTS = ["income", "balance", "cash"]
+
+
+def register(model_class):
+    '''
+    Class decorator that adds a valuation model to the registry
+    '''
+    MODELS[model_class.name] = model_class()
+    return model_class
+
+
+class ValuationModel:
+    '''
+    Base class for valuation models
+    Subclasses set a unique name, the fundamentals columns they need from each
+    statement ("income", "balance", "cash") as DB column names, the columns that
+    must be positive for the model to make sense, and implement compute
+    '''
+    name = None
+    columns = {}
+    positive_columns = []
+    outputs = []
+
+    def compute(self, df):
+        '''
+        Takes a multi-ticker df holding ticker, report_date and the union of the
+        columns every model asked for, sorted by ticker and report date
+        Returns a df of results indexed by ticker, with the columns listed in
+        outputs. These should be unique across models, since all results are
+        joined into one df
+        '''
+        raise NotImplementedError
+
+
+@register
+class StickerPriceModel(ValuationModel):
+    '''
+    Rule #1 sticker price, used by main.start, export and the value command
+    EPS is grown at the average equity growth rate for n years, priced at a PE
+    of 2x the growth rate, and discounted back at the required rate of return
+    '''
+    name = "sticker"
+    columns = {
+        "income": ["net_income", "shares_basic"],
+        "balance": ["total_equity"],
+        "cash": ["dividends_paid"],
+    }
+    positive_columns = ["shares_basic", "total_equity"]
+    outputs = ["equity_growth", "current_eps", "default_pe", "future_eps", "future_mkt_price", "sticker_price", "safety_price"]
+
+    def __init__(self, years=10, required_return=15.0):
+        self.years = years
+        self.required_return = required_return
+
+    def compute(self, df):
+        eps = (df["net_income"] + df["dividends_paid"].fillna(0)).div(df["shares_basic"])
+        growth = utils.growth_by_ticker(df, "total_equity", "equity")
+
+        # Only the latest report date of each ticker is valued. Each period's growth is
+        # rounded to 3 places before averaging, like utils.compound_growth_rates
+        last = df.groupby("ticker", sort=False).tail(1).index
+        equity_growth = growth.loc[last].round(3).mean(axis=1, skipna=False).to_numpy()
+
+        current_eps = eps.loc[last].to_numpy()
+        default_pe = equity_growth * 2
+
+        future_eps, future_mkt_price = sensitivity.future_prices(current_eps, equity_growth, default_pe, self.years)
+        sticker, mos = sensitivity.sticker_prices(current_eps, equity_growth, default_pe, self.years, self.required_return)
+
+        return pd.DataFrame({
+            "equity_growth": equity_growth,
+            "current_eps": current_eps,
+            "default_pe": default_pe,
+            "future_eps": future_eps,
+            "future_mkt_price": future_mkt_price,
+            "sticker_price": sticker,
+            "safety_price": mos,
+        }, index=df.loc[last, "ticker"].to_numpy())
+
+
+@register
+class CashFlowDCFModel(ValuationModel):
+    '''
+    Discounted operating cash flow per share
+    Cash flow is grown at its average growth rate for n years and each year is
+    discounted at the required rate of return, plus a terminal value of the
+    final year's cash flow at a fixed multiple
+    '''
+    name = "dcf"
+    columns = {
+        "income": ["shares_basic"],
+        "cash": ["net_cash_operating_activities"],
+    }
+    positive_columns = ["shares_basic", "net_cash_operating_activities"]
+    outputs = ["op_cash_growth", "dcf_value", "dcf_safety_price"]
+
+    def __init__(self, years=10, required_return=15.0, terminal_multiple=10.0):
+        self.years = years
+        self.required_return = required_return
+        self.terminal_multiple = terminal_multiple
+
+    def compute(self, df):
+        cash_per_share = df["net_cash_operating_activities"].div(df["shares_basic"])
+        growth = utils.growth_by_ticker(df, "net_cash_operating_activities", "op_cash")
+
+        last = df.groupby("ticker", sort=False).tail(1).index
+        cash_growth = growth.loc[last].mean(axis=1, skipna=False).to_numpy()
+
+        # One row per ticker, one column per projected year
+        t = np.arange(1, self.years + 1)
+        with np.errstate(over='ignore', invalid='ignore'):
+            projected = cash_per_share.loc[last].to_numpy()[:, np.newaxis] * (1 + cash_growth[:, np.newaxis] / 100) ** t
+            discount = (1 + self.required_return / 100) ** t
+            value = (projected / discount).sum(axis=1) + projected[:, -1] * self.terminal_multiple / discount[-1]
+
+        return pd.DataFrame({
+            "op_cash_growth": cash_growth,
+            "dcf_value": value,
+            "dcf_safety_price": value / 2,
+        }, index=df.loc[last, "ticker"].to_numpy())
+
+
+def required_columns(models):
+    '''
+    Returns a dict of statement -> union of the columns the given models need
+    '''
+    columns = {statement: [] for statement in STATEMENTS}
+    for model in models:
+        for statement, cols in model.columns.items():
+            columns[statement].extend(col for col in cols if col not in columns[statement])
+    return columns
+
+
+def fetch_fundamentals(conn, columns, tickers=None, period="annual"):
+    '''
+    This function gets the requested columns for every ticker (or just the given
+    tickers) in a single query, joining the three statements on report date
+    The join is a full outer join, so dates missing from a statement are kept,
+    with that statement's date column (see validation.DATE_COLUMNS) left empty
+    Returns a df sorted by ticker and report date
+    '''
+    tables = db.STATEMENT_TABLES[period]
+    aliases = {"income": "i", "balance": "b", "cash": "c"}
+    select = ["COALESCE(i.ticker, b.ticker, c.ticker)", "COALESCE(i.report_date, b.report_date, c.report_date)"] + \
+             [f"{aliases[statement]}.report_date" for statement in STATEMENTS] + \
+             [f"{aliases[statement]}.{col}" for statement in STATEMENTS for col in columns[statement]]
+    names = ["ticker", "report_date"] + [validation.DATE_COLUMNS[statement] for statement in STATEMENTS] + \
+            [col for statement in STATEMENTS for col in columns[statement]]
+
+    # Filter each statement before the join, so the ticker index is used on all three
+    where = ""
+    params = None
+    if tickers is not None:
+        where = "WHERE ticker = ANY(%(tickers)s)"
+        params = {"tickers": list(tickers)}
+
+    query = f"""SELECT
+                    {", ".join(select)}
+                FROM
+                    (SELECT * FROM {tables["income"]} {where}) i
+                FULL OUTER JOIN (SELECT * FROM {tables["balance"]} {where}) b
+                    ON b.ticker = i.ticker AND b.report_date = i.report_date
+                FULL OUTER JOIN (SELECT * FROM {tables["cash"]} {where}) c
+                    ON c.ticker = COALESCE(i.ticker, b.ticker) AND c.report_date = COALESCE(i.report_date, b.report_date)
+                ORDER BY
+                    1, 2;"""
+
+    df = db.postgres_to_df(conn, query, names, params=params)
+    if not isinstance(df, pd.DataFrame):
+        return None
+
+    numeric = names[5:]
+    df[numeric] = df[numeric].astype(np.float64)
+
+    # TTM figures are quarterly, keep one row per year back from each ticker's latest quarter
+    if period == "ttm":
+        quarters_back = df.groupby("ticker", sort=False).cumcount(ascending=False)
+        df = df[quarters_back % 4 == 0].reset_index(drop=True)
+
+    return df
+
+
+def compute_models(df, models):
+    '''
+    This function runs the given models over a multi-ticker df of fundamentals,
+    laid out like fetch_fundamentals returns it
+    The shared data quality checks (statements, alignment, history) run once.
+    Each model's positive_columns are then checked for that model only, so a
+    ticker set aside by one model is still valued by the others. Each model runs
+    once over the whole multi-ticker df of the tickers it kept
+    Returns a tuple of (df of all model results indexed by ticker, NaN where a
+    model rejected the ticker, and a df of rejected tickers with the model that
+    rejected them, "all" for the shared checks, and the reasons)
+    '''
+    df, shared_rejects = validation.validate_fundamentals(df)
+    rejects = [shared_rejects.assign(model="all")]
+    results = []
+
+    for model in models:
+        model_df, model_rejects = validation.validate_positive(df, model.positive_columns)
+        rejects.append(model_rejects.assign(model=model.name))
+        if not model_df.empty:
+            results.append(model.compute(model_df))
+
+    rejects = pd.concat(rejects, ignore_index=True)[["ticker", "model", "reasons"]]
+    if not results:
+        return pd.DataFrame(), rejects
+
+    return pd.concat(results, axis=1, sort=False), rejects
+
+
+def run_models(conn, tickers=None, model_names=None, period="annual"):
+    '''
+    This function runs the registered valuation models (or just the named ones)
+    over every ticker (or just the given tickers)
+    The union of the columns the models need is fetched once and passed through
+    compute_models, which checks the data and runs each model
+    Returns a tuple of (df of all model results indexed by ticker, df of rejected
+    tickers), see compute_models
+    '''
+    if model_names is None:
+        model_names = list(MODELS)
+    models = [MODELS[name] for name in model_names]
+
+    df = fetch_fundamentals(conn, required_columns(models), tickers, period)
+    if df is None:
+        return None, None
+
+    return compute_models(df, models)
+
+
+@click.command()
+@click.option('--tickers', default=None, help='Comma-separated list of tickers to value (default all)')
+@click.option('--models', 'model_names', default=None, help='Comma-separated list of models to run (default all)')
+@click.option('--period', type=click.Choice(['annual', 'ttm']), default='annual', help='Run on annual statements or trailing twelve month figures')
+@click.option('--output', default=None, help='Optional CSV path to save the results to')
+@click.option('--rejects', 'rejects_output', default=None, help='Optional CSV path to save the rejected tickers and reasons to')
+def value(tickers, model_names, period, output, rejects_output):
+    '''
+    Run the valuation models over many tickers in one pass
+    '''
+    if tickers is not None:
+        tickers = [ticker.strip() for ticker in tickers.split(",")]
+
+    if model_names is not None:
+        model_names = [name.strip() for name in model_names.split(",")]
+        unknown = [name for name in model_names if name not in MODELS]
+        if unknown:
+            print(f"Unknown models: {', '.join(unknown)}. Available models: {', '.join(MODELS)}")
+            return 1
+
+    conn = db.connect_db()
+    results, rejects = run_models(conn, tickers, model_names, period)
+    conn.close()
+
+    if results is None:
+        return 1
+
+    if not rejects.empty:
+        print(f"Skipped {rejects['ticker'].nunique()} ticker(s) that failed data quality checks for some or all models:")
+        print(rejects.to_string(index=False))
+
+        if rejects_output is not None:
+            rejects.to_csv(rejects_output, index=False)
+            print(f"Rejected tickers saved to {rejects_output}")
+
+    results.index.name = "ticker"
+    print(results.round(2))
+
+    if output is not None:
+        results.to_csv(output)
+        print(f"Results saved to {output}")
+
+
+if __name__ == "__main__":
+    value()
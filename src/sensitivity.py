@@ -0,0 +1,137 @@
+import numpy as np
+import pandas as pd
+
+# Percentiles reported for each scenario distribution
+PERCENTILES = [5, 10, 25, 50, 75, 90, 95]
+
+# Default ranges used when drawing random scenarios
+DEFAULT_YEARS = (8, 12)
+DEFAULT_REQUIRED_RETURN = (12.0, 18.0)
+
+# Floors for the random draws, a PE or growth below these makes the sticker
+# price meaningless (negative or flipping sign with the number of years)
+MIN_PE = 1.0
+MIN_GROWTH = -99.0
+
+
+def future_prices(eps, growth, pe, years=10):
+    '''
+    Takes current eps, growth rate (in %), PE ratio and number of years,
+    as scalars or numpy arrays that are broadcast against each other
+    Returns a tuple of (future_eps, future_mkt_price) after compounding for n years
+    '''
+    growth = np.asarray(growth, dtype=np.float64)
+    pe = np.asarray(pe, dtype=np.float64)
+    years = np.asarray(years, dtype=np.float64)
+
+    future_eps = eps * (1 + growth / 100) ** years
+    return future_eps, future_eps * pe
+
+
+def sticker_prices(eps, growth, pe, years=10, required_return=15.0):
+    '''
+    Vectorized Rule #1 sticker price calculation, used by the sticker model
+    Takes current eps, growth rate (in %), PE ratio, number of years and
+    minimum acceptable rate of return (in %). Every argument can be a scalar
+    or a numpy array, arrays are broadcast against each other.
+    Returns a tuple of (sticker_prices, margin_of_safety_prices)
+    NOTE: at 10 years and 15% the discount factor is (1.15)^10 = 4.0456
+    '''
+    years = np.asarray(years, dtype=np.float64)
+    required_return = np.asarray(required_return, dtype=np.float64)
+
+    # Future EPS and market price after compounding for n years
+    _, future_mkt_price = future_prices(eps, growth, pe, years)
+
+    # Discount the future price back at the minimum acceptable rate of return
+    sticker = future_mkt_price / (1 + required_return / 100) ** years
+    return sticker, sticker / 2
+
+
+def sensitivity_grid(eps, growth_rates, pe_ratios=None, years=(10,), required_returns=(15.0,)):
+    '''
+    This function evaluates the sticker price over every combination of the
+    given growth rates, PE ratios, years and required returns
+    If pe_ratios is None, the default PE of 2x growth is used for each growth rate
+    Returns a tuple of (sticker_prices, margin_of_safety_prices) arrays, with
+    one axis per input in the order growth, pe, years, required return
+    '''
+    growth = np.asarray(growth_rates, dtype=np.float64)
+
+    # Open mesh, so the grid is only materialised once in the final result
+    if pe_ratios is None:
+        g, y, r = np.ix_(growth, np.asarray(years, dtype=np.float64), np.asarray(required_returns, dtype=np.float64))
+        sticker, mos = sticker_prices(eps, g, g * 2, y, r)
+        # Keep a (length 1) PE axis so the shape is the same either way
+        return sticker[:, np.newaxis], mos[:, np.newaxis]
+
+    g, pe, y, r = np.ix_(growth, np.asarray(pe_ratios, dtype=np.float64), np.asarray(years, dtype=np.float64), np.asarray(required_returns, dtype=np.float64))
+    return sticker_prices(eps, g, pe, y, r)
+
+
+def grid_table(eps, growth_rates, pe_ratios=None, years=(10,), required_returns=(15.0,)):
+    '''
+    This function runs sensitivity_grid and flattens the result into a df with
+    one row per combination, in columns growth, pe, years, required_return,
+    sticker_price and safety_price
+    '''
+    sticker, mos = sensitivity_grid(eps, growth_rates, pe_ratios, years, required_returns)
+
+    # A NaN placeholder on the PE axis stands for the default PE of 2x growth
+    pe_axis = [np.nan] if pe_ratios is None else pe_ratios
+    g, pe, y, r = np.meshgrid(np.asarray(growth_rates, dtype=np.float64), np.asarray(pe_axis, dtype=np.float64),
+                              np.asarray(years, dtype=np.float64), np.asarray(required_returns, dtype=np.float64), indexing='ij')
+    if pe_ratios is None:
+        pe = g * 2
+
+    return pd.DataFrame({
+        "growth": g.ravel(),
+        "pe": pe.ravel(),
+        "years": y.ravel().astype(int),
+        "required_return": r.ravel(),
+        "sticker_price": sticker.ravel(),
+        "safety_price": mos.ravel(),
+    })
+
+
+def monte_carlo(eps, growth_mean, growth_std, n=1_000_000, pe_range=None, years=DEFAULT_YEARS, required_return=DEFAULT_REQUIRED_RETURN, seed=None):
+    '''
+    This function draws n random scenarios and evaluates the sticker price for each
+    Growth rate is drawn from a normal distribution around growth_mean, clipped at MIN_GROWTH
+    PE is 2x the drawn growth rate, unless a (low, high) pe_range is given. Either way
+    PE is clipped at MIN_PE, so negative growth draws give a small positive price rather
+    than a negative one, and stay in the distribution as the downside scenarios
+    Years is drawn uniformly from the (low, high) integer range, inclusive
+    Required return is drawn uniformly from the (low, high) range
+    Returns a tuple of (sticker_prices, margin_of_safety_prices) arrays
+    '''
+    rng = np.random.default_rng(seed)
+
+    growth = np.maximum(rng.normal(growth_mean, growth_std, n), MIN_GROWTH)
+
+    if pe_range is None:
+        pe = growth * 2
+    else:
+        pe = rng.uniform(pe_range[0], pe_range[1], n)
+    pe = np.maximum(pe, MIN_PE)
+
+    n_years = rng.integers(years[0], years[1], size=n, endpoint=True)
+    returns = rng.uniform(required_return[0], required_return[1], n)
+
+    return sticker_prices(eps, growth, pe, n_years, returns)
+
+
+def percentile_summary(values, percentiles=PERCENTILES):
+    '''
+    This function takes an array of scenario results and returns a dict
+    of percentile -> value, rounded to 2 places like the main result dict
+    Non-finite values (from inf growth rates) are left out of the summary
+    '''
+    values = np.ravel(values)
+    values = values[np.isfinite(values)]
+
+    if values.size == 0:
+        return {}
+
+    points = np.percentile(values, percentiles)
+    return {f"p{p}": round(float(v), 2) for p, v in zip(percentiles, points)}
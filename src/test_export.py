@@ -0,0 +1,63 @@
+import export
+import pandas as pd
+import pytest
+from datetime import date
+
+
+def fundamentals(ticker, n_years=7, shares=1000):
+    '''
+    Build the joined fundamentals of one ticker, like stream_batches reads them
+    '''
+    rows = []
+    for n in range(n_years):
+        rows.append((ticker, date(2013 + n, 12, 31), shares, 5000 + n * 500, 400 + n * 50, 2000, -1000, -80, 480, 1000,
+                     3000 + n * 300, 800, 100, 600 + n * 60, None if n % 2 else -50))
+    return pd.DataFrame(rows, columns=export.FUNDAMENTAL_COLUMNS)
+
+
+def make_batch(ticker, n_years=7):
+    '''
+    Build one batch of joined fundamentals and derived metrics for ticker
+    '''
+    batch, _ = export.derive_metrics(fundamentals(ticker, n_years))
+    return batch
+
+
+def read_back(path, file_format):
+    if file_format == "csv":
+        return pd.read_csv(path)
+    if file_format == "parquet":
+        return export.pq.read_table(path).to_pandas()
+    with export.pa.ipc.open_file(path) as reader:
+        return reader.read_all().to_pandas()
+
+
+@pytest.mark.parametrize("file_format", ["csv", "parquet", "arrow"])
+def test_writers_append_every_batch(tmp_path, file_format):
+    if file_format != "csv" and export.pa is None:
+        pytest.skip("pyarrow is not installed")
+
+    batches = [make_batch(ticker) for ticker in ["AAA", "BBB", "CCC"]]
+    path = str(tmp_path / f"export.{file_format}")
+
+    writer = export.WRITERS[file_format](path)
+    for batch in batches:
+        writer.write(batch[export.EXPORT_COLUMNS])
+    writer.close()
+
+    result = read_back(path, file_format)
+    assert len(result.index) == sum(len(batch.index) for batch in batches)
+    assert list(result.columns) == export.EXPORT_COLUMNS
+    assert list(result["ticker"].unique()) == ["AAA", "BBB", "CCC"]
+
+
+def test_rejected_tickers_get_no_model_results():
+    df = pd.concat([fundamentals("AAA"), fundamentals("BBB", shares=0), fundamentals("CCC", n_years=4)], ignore_index=True)
+    batch, rejects = export.derive_metrics(df)
+
+    latest = batch.groupby("ticker").tail(1).set_index("ticker")
+    assert latest.loc["AAA", export.MODEL_COLUMNS].notna().all()
+    assert latest.loc[["BBB", "CCC"], export.MODEL_COLUMNS].isna().all().all()
+    assert len(batch.index) == len(df.index)
+
+    assert set(zip(rejects["ticker"], rejects["model"])) == {("CCC", "all"), ("BBB", "sticker"), ("BBB", "dcf")}
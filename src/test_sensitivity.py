@@ -0,0 +1,33 @@
+import sensitivity
+import numpy as np
+
+
+def test_sticker_prices_match_rule_one_formula():
+    eps = 2.5
+    growth = np.array([5.0, 10.0, 18.5])
+    sticker, mos = sensitivity.sticker_prices(eps, growth, growth * 2, 10, 15.0)
+
+    # The original calculation in main.start
+    expected = ((growth / 100 + 1) ** 10) * eps * (growth * 2) / 4.0456
+    np.testing.assert_allclose(sticker, expected, rtol=1e-4)
+    np.testing.assert_allclose(mos, sticker / 2)
+
+
+def test_monte_carlo_is_reproducible_with_a_seed():
+    first = sensitivity.monte_carlo(2.5, 10.0, 5.0, n=1000, seed=42)
+    second = sensitivity.monte_carlo(2.5, 10.0, 5.0, n=1000, seed=42)
+
+    np.testing.assert_array_equal(first[0], second[0])
+    np.testing.assert_array_equal(first[1], second[1])
+    assert (first[0] > 0).all()
+
+
+def test_grid_table_has_a_row_per_combination():
+    grid = sensitivity.grid_table(2.5, [5.0, 10.0], None, [8, 10], [12.0, 15.0, 18.0])
+
+    assert len(grid.index) == 2 * 2 * 3
+    np.testing.assert_allclose(grid["pe"], grid["growth"] * 2)
+
+    row = grid[(grid["growth"] == 10.0) & (grid["years"] == 10) & (grid["required_return"] == 15.0)].iloc[0]
+    sticker, _ = sensitivity.sticker_prices(2.5, 10.0, 20.0, 10, 15.0)
+    assert row["sticker_price"] == sticker
@@ -0,0 +1,65 @@
+import ttm
+import json
+from datetime import date
+
+QUARTER_ENDS = [(3, 31), (6, 30), (9, 30), (12, 31)]
+
+
+def quarters(n, start_year=2015):
+    '''
+    n consecutive quarter end dates, with a revenue value for each
+    '''
+    dates = [date(start_year + i // 4, *QUARTER_ENDS[i % 4]) for i in range(n)]
+    return [(d, {"revenue": 100.0 + i * 7, "net_income": 10.0 + i}) for i, d in enumerate(dates)]
+
+
+def test_sum_is_the_last_four_quarters():
+    rolling = ttm.RollingTTM()
+    pushed = []
+    for report_date, values in quarters(12):
+        result = rolling.push(report_date, values)
+        pushed.append(values)
+
+        if len(pushed) < 4:
+            assert result["revenue"] is None
+        else:
+            assert result["revenue"] == sum(v["revenue"] for v in pushed[-4:])
+            assert result["net_income"] == sum(v["net_income"] for v in pushed[-4:])
+
+    # Metrics that were never reported stay empty
+    assert result["dividends_paid"] is None
+
+
+def test_missing_value_empties_the_window_until_it_drops_out():
+    rolling = ttm.RollingTTM()
+    data = quarters(9)
+    data[4][1]["revenue"] = None
+
+    results = [rolling.push(report_date, values)["revenue"] for report_date, values in data]
+
+    assert results[3] is not None
+    assert results[4:8] == [None] * 4
+    assert results[8] == sum(values["revenue"] for _, values in data[5:9])
+
+
+def test_gap_between_quarters_is_not_a_ttm_figure():
+    rolling = ttm.RollingTTM()
+    data = quarters(4) + [(date(2017, 3, 31), {"revenue": 1.0, "net_income": 1.0})]
+
+    results = [rolling.push(report_date, values)["revenue"] for report_date, values in data]
+    assert results[3] is not None
+    assert results[4] is None
+
+
+def test_restored_state_continues_the_same_sums():
+    data = quarters(10)
+    rolling = ttm.RollingTTM()
+    for report_date, values in data[:6]:
+        rolling.push(report_date, values)
+
+    # State goes through JSON, like the f_ttm_state JSONB column
+    restored = ttm.RollingTTM(json.loads(json.dumps(rolling.to_state())))
+    assert restored.last_date == data[5][0]
+
+    for report_date, values in data[6:]:
+        assert restored.push(report_date, values) == rolling.push(report_date, values)
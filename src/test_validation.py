@@ -0,0 +1,89 @@
+import models
+import validation
+import pandas as pd
+from datetime import date
+
+
+def fundamentals(ticker, n_years=7, **overrides):
+    '''
+    Aligned fundamentals for one ticker, laid out like models.fetch_fundamentals
+    overrides maps a column to a dict of row -> value
+    '''
+    dates = [date(2013 + n, 12, 31) for n in range(n_years)]
+    df = pd.DataFrame({
+        "ticker": ticker,
+        "report_date": dates,
+        "income_date": dates,
+        "balance_date": dates,
+        "cash_date": dates,
+        "net_income": [400.0 + n * 50 for n in range(n_years)],
+        "shares_basic": 1000.0,
+        "total_equity": [3000.0 + n * 300 for n in range(n_years)],
+        "dividends_paid": 0.0,
+        "net_cash_operating_activities": [600.0 + n * 60 for n in range(n_years)],
+    })
+    for col, rows in overrides.items():
+        for row, value in rows.items():
+            df.loc[row, col] = value
+    return df
+
+
+def reasons(rejects):
+    return dict(zip(rejects["ticker"], rejects["reasons"]))
+
+
+def test_clean_ticker_passes():
+    df = fundamentals("AAA")
+    valid, rejects = validation.validate_fundamentals(df, ["shares_basic", "total_equity"])
+
+    assert rejects.empty
+    assert len(valid.index) == len(df.index)
+
+
+def test_shared_checks():
+    df = pd.concat([
+        fundamentals("AAA"),
+        fundamentals("SHORT", n_years=5),
+        fundamentals("SHIFT", balance_date={3: date(2016, 9, 30)}),
+        fundamentals("NOCASH", cash_date={n: None for n in range(7)}),
+    ], ignore_index=True)
+    valid, rejects = validation.validate_fundamentals(df)
+
+    assert list(valid["ticker"].unique()) == ["AAA"]
+    assert reasons(rejects) == {
+        "SHORT": f"fewer than {validation.MIN_YEARS} years of history",
+        "SHIFT": "misaligned report dates across statements",
+        "NOCASH": "missing cash statement; fewer than 6 years of history",
+    }
+
+
+def test_positive_columns_only_checked_at_base_rows():
+    df = pd.concat([
+        # 2 rows back from the latest isn't a growth base row
+        fundamentals("OK", total_equity={4: -10.0}),
+        # 3 rows back is
+        fundamentals("BAD", total_equity={3: -10.0}),
+        fundamentals("ZERO", shares_basic={6: 0.0}),
+    ], ignore_index=True)
+    valid, rejects = validation.validate_fundamentals(df, ["shares_basic", "total_equity"])
+
+    assert list(valid["ticker"].unique()) == ["OK"]
+    assert reasons(rejects) == {
+        "BAD": "missing or non-positive total_equity",
+        "ZERO": "missing or non-positive shares_basic",
+    }
+
+
+def test_positive_columns_are_checked_per_model():
+    df = pd.concat([
+        fundamentals("AAA"),
+        fundamentals("NEGCASH", net_cash_operating_activities={6: -5.0}),
+        fundamentals("SHORT", n_years=4),
+    ], ignore_index=True)
+    results, rejects = models.compute_models(df, [models.MODELS["sticker"], models.MODELS["dcf"]])
+
+    assert set(zip(rejects["ticker"], rejects["model"])) == {("SHORT", "all"), ("NEGCASH", "dcf")}
+    assert results.loc[["AAA", "NEGCASH"], "sticker_price"].notna().all()
+    assert results.loc["AAA", "dcf_value"] > 0
+    assert pd.isna(results.loc["NEGCASH", "dcf_value"])
+    assert "SHORT" not in results.index
@@ -0,0 +1,250 @@
+import database as db
+import pandas as pd
+import psycopg2
+from psycopg2.extras import Json, execute_values
+from collections import deque
+from datetime import date
+
+# Flow metrics are summed over the last four quarters, point in time
+# metrics (balance sheet values, share count) take the latest quarter
+FLOW_METRICS = {
+    "income": ["revenue", "net_income", "gross_profit", "operating_expenses", "income_tax_benefit_net", "pretax_income_loss", "operating_income_loss"],
+    "cash": ["net_cash_operating_activities", "dividends_paid"],
+}
+POINT_METRICS = {
+    "income": ["shares_basic"],
+    "balance": ["total_equity", "long_term_debt", "short_term_debt"],
+}
+
+# Four quarters should end within roughly 9 months of each other,
+# anything wider means a quarter is missing and the sum isn't a TTM figure
+MAX_WINDOW_DAYS = 300
+
+STATE_TABLE = "f_ttm_state"
+
+CREATE_TABLES = [
+    f"""CREATE TABLE IF NOT EXISTS {STATE_TABLE} (
+            ticker VARCHAR(12) PRIMARY KEY,
+            last_report_date DATE,
+            state JSONB);""",
+    """CREATE TABLE IF NOT EXISTS f_income_stmts_ttm (
+            ticker VARCHAR(12),
+            report_date DATE,
+            shares_basic BIGINT,
+            revenue BIGINT,
+            net_income BIGINT,
+            gross_profit BIGINT,
+            operating_expenses BIGINT,
+            income_tax_benefit_net BIGINT,
+            pretax_income_loss BIGINT,
+            operating_income_loss BIGINT,
+            PRIMARY KEY (ticker, report_date));""",
+    """CREATE TABLE IF NOT EXISTS f_balance_sheets_ttm (
+            ticker VARCHAR(12),
+            report_date DATE,
+            total_equity BIGINT,
+            long_term_debt BIGINT,
+            short_term_debt BIGINT,
+            PRIMARY KEY (ticker, report_date));""",
+    """CREATE TABLE IF NOT EXISTS f_cashflow_ttm (
+            ticker VARCHAR(12),
+            report_date DATE,
+            net_cash_operating_activities BIGINT,
+            dividends_paid BIGINT,
+            PRIMARY KEY (ticker, report_date));""",
+]
+
+
+class RollingTTM:
+    '''
+    Rolling four quarter window for a single ticker
+    Keeps the last four values and a running sum for every flow metric,
+    so each new quarter is added in O(1) without looking at older history
+    '''
+
+    def __init__(self, state=None):
+        self.dates = deque(maxlen=4)
+        self.windows = {metric: deque(maxlen=4) for metric in self.flow_metrics()}
+        self.sums = {metric: 0 for metric in self.flow_metrics()}
+        # Number of missing (None) values in each window
+        self.missing = {metric: 0 for metric in self.flow_metrics()}
+
+        if state is not None:
+            self.dates.extend(date.fromisoformat(d) for d in state["dates"])
+            for metric, values in state["windows"].items():
+                if metric not in self.windows:
+                    continue
+                self.windows[metric].extend(values)
+                self.sums[metric] = sum(v for v in values if v is not None)
+                self.missing[metric] = sum(1 for v in values if v is None)
+
+    @staticmethod
+    def flow_metrics():
+        return [metric for metrics in FLOW_METRICS.values() for metric in metrics]
+
+    @property
+    def last_date(self):
+        return self.dates[-1] if self.dates else None
+
+    def push(self, report_date, values):
+        '''
+        Add a new quarter, values is a dict of metric -> quarterly value
+        Returns a dict of metric -> TTM value, with None for every metric
+        if fewer than four consecutive quarters are available yet
+        '''
+        full = len(self.dates) == 4
+        self.dates.append(report_date)
+
+        for metric, window in self.windows.items():
+            value = values.get(metric)
+
+            # Take the oldest value out of the running sum before the deque drops it
+            if full:
+                dropped = window[0]
+                if dropped is None:
+                    self.missing[metric] -= 1
+                else:
+                    self.sums[metric] -= dropped
+
+            window.append(value)
+            if value is None:
+                self.missing[metric] += 1
+            else:
+                self.sums[metric] += value
+
+        complete = len(self.dates) == 4 and (self.dates[-1] - self.dates[0]).days <= MAX_WINDOW_DAYS
+        return {metric: (self.sums[metric] if complete and self.missing[metric] == 0 else None) for metric in self.windows}
+
+    def to_state(self):
+        return {
+            "dates": [d.isoformat() for d in self.dates],
+            "windows": {metric: list(window) for metric, window in self.windows.items()},
+        }
+
+
+def ensure_ttm_tables(conn):
+    '''
+    Create the TTM state and series tables if they don't exist yet
+    '''
+    cursor = conn.cursor()
+    for query in CREATE_TABLES:
+        cursor.execute(query)
+    conn.commit()
+    cursor.close()
+
+
+def load_state(conn, ticker):
+    '''
+    Return the RollingTTM for ticker saved by the last update,
+    or an empty one if the ticker has no TTM data yet
+    '''
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT state FROM {STATE_TABLE} WHERE ticker = %s;", (ticker,))
+    row = cursor.fetchone()
+    cursor.close()
+
+    if row is None:
+        return RollingTTM()
+    return RollingTTM(row[0])
+
+
+def new_quarters(conn, ticker, after=None):
+    '''
+    Get the quarterly statement rows for ticker reported after the given date
+    (all of them if after is None), joined on report date and sorted oldest first
+    '''
+    tables = db.STATEMENT_TABLES["quarterly"]
+    income_cols = FLOW_METRICS["income"] + POINT_METRICS["income"]
+    balance_cols = POINT_METRICS["balance"]
+    cash_cols = FLOW_METRICS["cash"]
+
+    query = f"""SELECT
+                    i.report_date,
+                    {", ".join(f"i.{col}" for col in income_cols)},
+                    {", ".join(f"b.{col}" for col in balance_cols)},
+                    {", ".join(f"c.{col}" for col in cash_cols)}
+                FROM
+                    {tables["income"]} i
+                JOIN {tables["balance"]} b
+                    ON b.ticker = i.ticker AND b.report_date = i.report_date
+                JOIN {tables["cash"]} c
+                    ON c.ticker = i.ticker AND c.report_date = i.report_date
+                WHERE
+                    i.ticker = %s AND i.report_date > %s
+                ORDER BY
+                    i.report_date;"""
+
+    # Never cache this, it has to see quarters written moments ago
+    columns = ["report_date"] + income_cols + balance_cols + cash_cols
+    return db.postgres_to_df(conn, query, columns, params=(ticker, after or date.min), cache=False)
+
+
+def update_ttm(conn, ticker):
+    '''
+    This function rolls any quarters added since the last update into the
+    TTM tables for ticker. Only the new quarterly rows are read, the saved
+    window from the previous run supplies the earlier three quarters
+    Returns the number of TTM rows written
+    '''
+    ensure_ttm_tables(conn)
+    rolling = load_state(conn, ticker)
+
+    quarters = new_quarters(conn, ticker, rolling.last_date)
+    if not isinstance(quarters, pd.DataFrame):
+        return 0
+    if quarters.empty:
+        print(f"TTM data for {ticker} is already up to date.")
+        return 0
+
+    rows = {"income": [], "balance": [], "cash": []}
+    for record in quarters.to_dict("records"):
+        # Pandas gives NaN for NULLs and numpy ints otherwise, store plain ints or None
+        values = {k: (None if pd.isna(v) else int(v)) for k, v in record.items() if k != "report_date"}
+        ttm_values = rolling.push(record["report_date"], values)
+
+        # Nothing to write until there are four consecutive quarters
+        if all(v is None for v in ttm_values.values()):
+            continue
+
+        values.update(ttm_values)
+        for statement in rows:
+            cols = FLOW_METRICS.get(statement, []) + POINT_METRICS.get(statement, [])
+            rows[statement].append((ticker, record["report_date"]) + tuple(values[col] for col in cols))
+
+    tables = db.STATEMENT_TABLES["ttm"]
+    cursor = conn.cursor()
+
+    try:
+        for statement, tuples in rows.items():
+            if not tuples:
+                continue
+            cols = ["ticker", "report_date"] + FLOW_METRICS.get(statement, []) + POINT_METRICS.get(statement, [])
+            execute_values(cursor, f"""INSERT INTO {tables[statement]} ({", ".join(cols)}) VALUES %s
+                                       ON CONFLICT (ticker, report_date) DO NOTHING""", tuples)
+
+        cursor.execute(f"""INSERT INTO {STATE_TABLE} (ticker, last_report_date, state) VALUES (%s, %s, %s)
+                           ON CONFLICT (ticker) DO UPDATE SET last_report_date = EXCLUDED.last_report_date, state = EXCLUDED.state;""",
+                       (ticker, rolling.last_date, Json(rolling.to_state())))
+        for table_name in tables.values():
+            db.bump_table_version(cursor, table_name)
+        conn.commit()
+    except (Exception, psycopg2.DatabaseError) as e:
+        print(f"Error updating TTM data: {e}")
+        conn.rollback()
+        cursor.close()
+        return 0
+
+    cursor.close()
+
+    print(f"Added {len(rows['income'])} TTM period(s) for {ticker}.")
+    return len(rows["income"])
+
+
+def to_annual_points(df):
+    '''
+    Takes a TTM series (one row per quarter, oldest first) and keeps every
+    fourth row counting back from the latest, so consecutive rows are a year
+    apart and the annual growth calculations can run on it unchanged
+    '''
+    start = (len(df.index) - 1) % 4
+    return df.iloc[start::4].reset_index(drop=True)
@@ -1,26 +1,71 @@
 import pandas as pd
 import psycopg2
+from psycopg2.extras import execute_values
 import database as db
+import ttm
 import os
 import json
+import hashlib
 from alpha_vantage.fundamentaldata import FundamentalData
-from datetime import datetime
+from datetime import datetime, timedelta
 
 token = os.environ.get("AV-API-TOKEN")
 
 CURRENT_FY = 2020
 # These are the options available to update db
-TO_UPDATE_LIST = ["stock", "stocks"]
+TO_UPDATE_LIST = ["stock", "stocks", "quarterly"]
 # This is the selection chosen to update
 UPDATE = "stock"
 STOCK = "AMAT"
 
+# Listing columns in d_stocks, the rows read from companylist.csv per chunk,
+# and the per row hash used to find new or changed listings
+STOCK_COLUMNS = ["ticker", "company_name", "sector", "industry"]
+STOCKS_CHUNK_SIZE = 2000
+STOCK_HASH_SQL = "md5(concat_ws('|', ticker, coalesce(company_name, ''), coalesce(sector, ''), coalesce(industry, '')))"
+
+# Quarter end dates from different sources (SimFin, Alpha Vantage) can differ by a few days,
+# a quarter within this many days of the latest one in the DB is treated as that same quarter
+QUARTER_MATCH_DAYS = 45
+
+
+def stock_row_hashes(df):
+    '''
+    This function takes a df of d_stocks columns and returns the md5 hash of
+    each row's listing fields, matching STOCK_HASH_SQL on the database side
+    '''
+    joined = df[STOCK_COLUMNS].fillna("").astype(str).agg("|".join, axis=1)
+    return joined.map(lambda row: hashlib.md5(row.encode()).hexdigest())
+
+
+def stock_tuples(df):
+    '''
+    Returns the d_stocks columns of df as a list of tuples, with NULL (None) for missing values
+    '''
+    return [tuple(None if pd.isna(v) else v for v in row) for row in df[STOCK_COLUMNS].itertuples(index=False)]
+
+
+def get_stock_hashes(conn):
+    '''
+    This function returns a dict of ticker -> row hash for every listing
+    already in d_stocks. The hashes are computed by Postgres so only the
+    ticker and a 32 character hash per row come over the network
+    '''
+    query = f"""SELECT ticker, {STOCK_HASH_SQL}
+                FROM d_stocks;"""
+
+    existing = db.postgres_to_df(conn, query, ["ticker", "hash"], cache=False)
+    if not isinstance(existing, pd.DataFrame):
+        return None
+    return dict(zip(existing["ticker"], existing["hash"]))
+
 
 def update_stocks_table(conn):
     '''
     This function takes a CSV of stock symbols named "companylist.csv"
     Must container columns Symbol, Name, Sector, Industry
-    Writes them to the database
+    The CSV is read in chunks, and only listings that are new or have
+    changed since the last update are written to the database
     '''
 
     # Open CSV file containing stock list
@@ -28,45 +73,73 @@ def update_stocks_table(conn):
     update_file = dir + "/src/data/companylist.csv"
 
     try:
-        new_data = pd.read_csv(update_file, sep=",")
+        reader = pd.read_csv(update_file, sep=",", chunksize=STOCKS_CHUNK_SIZE, usecols=["Symbol", "Name", "Sector", "industry"])
     except (Exception, FileNotFoundError) as e:
         print("No stock csv found. Please save a file in the data/ dir called 'companylist.csv'.")
         return
 
-    new_data['Symbol'] = new_data['Symbol'].str.replace('^','-')
-    new_data['Name'] = new_data['Name'].str.replace('&#39;',"'")
-
-    # Get the columns we are interested in and save to temp csv
-    new_data = new_data[["Symbol", "Name", "Sector", "industry"]].copy()
-    new_data = new_data.rename(columns={
-                "Symbol":"ticker",
-                "Name":"company_name",
-                "Sector":"sector",
-                "industry":"industry"})
-
-    # Create a list of tuples from the DF
-    tuples = [tuple(x) for x in new_data.to_numpy()]
+    existing = get_stock_hashes(conn)
+    if existing is None:
+        return 1
 
-    # Comma-separated df column names
-    cols = ','.join(list(new_data.columns))
     table_name = 'd_stocks'
-
-    # Craft the query
-    query = f"""INSERT INTO {table_name} ({cols}) VALUES (%s,%s,%s,%s)"""
+    cols = ','.join(STOCK_COLUMNS)
+    n_new = 0
+    n_changed = 0
 
     # Create DB cursor
     cursor = conn.cursor()
-    
-    try:
-        cursor.executemany(query, tuples)
-        conn.commit()
-    except (Exception, psycopg2.DatabaseError) as e:
-        print(f"Error: {e}")
-        conn.rollback()
-        cursor.close()
-        return 1
-    print(f"Stocks added to table complete.")
+
+    for chunk in reader:
+        chunk['Symbol'] = chunk['Symbol'].astype(str).str.replace('^', '-', regex=False)
+        chunk['Name'] = chunk['Name'].str.replace('&#39;', "'", regex=False)
+
+        chunk = chunk.rename(columns={
+                    "Symbol":"ticker",
+                    "Name":"company_name",
+                    "Sector":"sector",
+                    "industry":"industry"})
+
+        # If a ticker is listed twice, the last listing wins
+        chunk = chunk.drop_duplicates(subset="ticker", keep="last")
+        chunk["hash"] = stock_row_hashes(chunk)
+
+        known = chunk["ticker"].map(existing)
+        new_rows = chunk[known.isna()]
+        changed_rows = chunk[known.notna() & (known != chunk["hash"])]
+
+        if new_rows.empty and changed_rows.empty:
+            continue
+
+        # Missing values are stored as NULL
+        upserts = pd.concat([new_rows, changed_rows])
+        new_tuples = stock_tuples(new_rows)
+        changed_tuples = stock_tuples(changed_rows)
+
+        try:
+            # Changed listings are updated in place, so rows referencing the ticker are left alone
+            # and d_stocks doesn't need a unique constraint on ticker
+            if changed_tuples:
+                execute_values(cursor, f"""UPDATE {table_name} AS s
+                                           SET company_name = v.company_name, sector = v.sector, industry = v.industry
+                                           FROM (VALUES %s) AS v ({cols})
+                                           WHERE s.ticker = v.ticker""", changed_tuples)
+            if new_tuples:
+                execute_values(cursor, f"INSERT INTO {table_name} ({cols}) VALUES %s", new_tuples)
+            db.bump_table_version(cursor, table_name)
+            conn.commit()
+        except (Exception, psycopg2.DatabaseError) as e:
+            print(f"Error: {e}")
+            conn.rollback()
+            cursor.close()
+            return 1
+
+        existing.update(zip(upserts["ticker"], upserts["hash"]))
+        n_new += len(new_rows.index)
+        n_changed += len(changed_rows.index)
+
     cursor.close()
+    print(f"Stocks table update complete. {n_new} new and {n_changed} changed listing(s) written.")
 
 
 def check_for_stock(conn, ticker):
@@ -100,41 +173,54 @@ def check_for_stock(conn, ticker):
 
 
 
-def get_updated_financials(conn, ticker):
+def get_updated_financials(conn, ticker, period="annual"):
     '''
     This function queries the Postgres DB for the ticker
-    It receives the most recent year of data we have, and then retrieves most current
-    years of data from Alpha Vantage
+    It receives the most recent year (or quarter) of data we have, and then retrieves
+    most current years (or quarters) of data from Alpha Vantage
+    period is either "annual" or "quarterly"
     '''
+    tables = db.STATEMENT_TABLES[period]
 
     # Query the income_statements table for the ticker in question
     query = f"""SELECT ticker, fiscal_year, report_date
-                FROM f_income_stmts_annual
+                FROM {tables["income"]}
                 WHERE ticker = '{ticker}'
-                ORDER BY fiscal_year;"""
+                ORDER BY report_date;"""
     
     # Convert query result to pandas df
-    stock_report_dates = db.postgres_to_df(conn, query, ["ticker", "year", "report_date"])
+    stock_report_dates = db.postgres_to_df(conn, query, ["ticker", "year", "report_date"], cache=False)
+    if not isinstance(stock_report_dates, pd.DataFrame):
+        return None
     
     # If we don't have financial data yet, let the user know
-    if stock_report_dates.empty:
+    # Quarterly data is new, so a ticker without any gets its full quarterly history below
+    if stock_report_dates.empty and period == "annual":
         print(f"Sorry, we don't have any financial data yet for STOCK: {ticker}.")
         # TODO: create function to add NEW stock's data to database
         return None
-    
-    # If we do have the stock in our financial data, get the most recent year
-    db_current = stock_report_dates.iloc[-1]["year"]
-    current_report_date = stock_report_dates.iloc[-1]["report_date"]
-    current_report_year = str(current_report_date.year)
-    print(f"Most recent year we have {ticker} data for:", current_report_year, current_report_date)
+
+    if stock_report_dates.empty:
+        print(f"No quarterly data yet for {ticker}, retrieving all available quarters.")
+        current_report_date = None
+    else:
+        # If we do have the stock in our financial data, get the most recent year
+        current_report_date = stock_report_dates.iloc[-1]["report_date"]
+        current_report_year = str(current_report_date.year)
+        print(f"Most recent year we have {ticker} data for:", current_report_year, current_report_date)
 
     # Create fundamental data retrieval obj (alpha vantage)
     fd = FundamentalData(key=token, output_format="pandas")
 
     # Get income statement from alpha vantage
-    income_stmts, _ = fd.get_income_statement_annual(symbol=ticker)
-    balance_sheets, _ = fd.get_balance_sheet_annual(symbol=ticker)
-    cash_stmts, _ = fd.get_cash_flow_annual(symbol=ticker)
+    if period == "quarterly":
+        income_stmts, _ = fd.get_income_statement_quarterly(symbol=ticker)
+        balance_sheets, _ = fd.get_balance_sheet_quarterly(symbol=ticker)
+        cash_stmts, _ = fd.get_cash_flow_quarterly(symbol=ticker)
+    else:
+        income_stmts, _ = fd.get_income_statement_annual(symbol=ticker)
+        balance_sheets, _ = fd.get_balance_sheet_annual(symbol=ticker)
+        cash_stmts, _ = fd.get_cash_flow_annual(symbol=ticker)
 
     #print(balance_sheets.iloc[0:3].T)
 
@@ -143,19 +229,31 @@ def get_updated_financials(conn, ticker):
     balance_sheets = balance_sheets.reset_index()
     cash_stmts = cash_stmts.reset_index()
 
-    # Get index of row of most av df, correlating to most recent data we have in DB
-    av_db_current = None
-    for index, row in income_stmts.iterrows():
-        year = row["fiscalDateEnding"][:4]
-        # Store index of current data in alpha vantage df
-        if year == current_report_year:
-            print("Confirm current data year check (should match above): ", year, index)
-            av_db_current = index
-    
-    # Get pandas df of just everything AFTER the most recent year we have data for
-    income_stmts_new = income_stmts.iloc[0:av_db_current][:]
-    balance_sheets_new = balance_sheets.iloc[0:av_db_current][:]
-    cash_stmts_new = cash_stmts.iloc[0:av_db_current][:]
+    if period == "quarterly":
+        # Keep every quarter after the latest one we have, rather than matching its date
+        # exactly, since it may have come from another source (see QUARTER_MATCH_DAYS)
+        # (no date keeps every row, when there is no data in the DB yet)
+        if current_report_date is None:
+            income_stmts_new, balance_sheets_new, cash_stmts_new = income_stmts, balance_sheets, cash_stmts
+        else:
+            cutoff = str(current_report_date + timedelta(days=QUARTER_MATCH_DAYS))
+            income_stmts_new = income_stmts[income_stmts["fiscalDateEnding"] > cutoff]
+            balance_sheets_new = balance_sheets[balance_sheets["fiscalDateEnding"] > cutoff]
+            cash_stmts_new = cash_stmts[cash_stmts["fiscalDateEnding"] > cutoff]
+    else:
+        # Get index of row of most av df, correlating to most recent data we have in DB
+        av_db_current = None
+        for index, row in income_stmts.iterrows():
+            year = row["fiscalDateEnding"][:len(current_report_year)]
+            # Store index of current data in alpha vantage df
+            if year == current_report_year:
+                print("Confirm current data year check (should match above): ", year, index)
+                av_db_current = index
+
+        # Get pandas df of just everything AFTER the most recent year we have data for
+        income_stmts_new = income_stmts.iloc[0:av_db_current][:]
+        balance_sheets_new = balance_sheets.iloc[0:av_db_current][:]
+        cash_stmts_new = cash_stmts.iloc[0:av_db_current][:]
 
     # If any of these are empty DF's, that means we don't have new data to add
     if income_stmts_new.empty or balance_sheets_new.empty or cash_stmts_new.empty:
@@ -182,6 +280,31 @@ def get_updated_financials(conn, ticker):
         return None
 
 
+def ensure_quarterly_tables(conn):
+    '''
+    Create the quarterly statement tables if they don't exist yet
+    They copy the column layout of the annual tables, since the
+    statement inserts in add_financials_to_db are positional
+    A unique (ticker, report_date) index makes a repeated quarter fail
+    the insert, rather than be double counted in the TTM sums
+    '''
+    cursor = conn.cursor()
+    try:
+        for statement, table_name in db.STATEMENT_TABLES["quarterly"].items():
+            annual_table = db.STATEMENT_TABLES["annual"][statement]
+            cursor.execute(f"""CREATE TABLE IF NOT EXISTS {table_name}
+                               (LIKE {annual_table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING INDEXES);""")
+            cursor.execute(f"DROP INDEX IF EXISTS {table_name}_ticker_date_idx;")
+            cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {table_name}_ticker_date_key ON {table_name} (ticker, report_date);")
+        conn.commit()
+    except (Exception, psycopg2.DatabaseError) as e:
+        print(f"Error creating quarterly tables: {e}")
+        conn.rollback()
+        cursor.close()
+        return 1
+    cursor.close()
+
+
 def get_var(row, map, db_key, alt_row=None):
     '''
     This function is used in add_financials_to_db function to retrieve 
@@ -213,12 +336,15 @@ def get_var(row, map, db_key, alt_row=None):
     
 
 
-def add_financials_to_db(conn, ticker, data):
+def add_financials_to_db(conn, ticker, data, period="annual"):
     '''
     This function connects to the database and takes in financial stmt data to be added
     The `data` var is a dictionary containing keys: income_stmts, balance_sheets, cash_stmts
     Data from each of these is added to the respective tables in the db
+    period is either "annual" or "quarterly"
     '''
+    tables = db.STATEMENT_TABLES[period]
+    fiscal_period = "FY" if period == "annual" else "Q"
     # Open a DB cursor
     cursor = conn.cursor()
 
@@ -244,37 +370,40 @@ def add_financials_to_db(conn, ticker, data):
         # Convert report date to date object
         report_date = datetime.strptime(row[income_map["report_date"]], '%Y-%m-%d').date()
         # Craft list of values to enter, in sequence with DB columns (remember, shares comes from balance sheet)
-        income_tuple = (ticker, None, get_var(row, income_map, "currency"), None, "FY", report_date, None, None, get_var(row, income_map, "shares_basic", balance_new.iloc[index]), None, get_var(row, income_map, "revenue"), get_var(row, income_map, "cost_of_revenue"), get_var(row, income_map, "gross_profit"), get_var(row, income_map, "operating_expenses"), get_var(row, income_map, "selling_general_admin"), get_var(row, income_map, "research_and_development"), None, get_var(row, income_map, "operating_income_loss"), get_var(row, income_map, "non_operating_income_loss"), get_var(row, income_map, "interest_expense_net"), None, None, get_var(row, income_map, "pretax_income_loss"), get_var(row, income_map, "income_tax_benefit_net"), get_var(row, income_map, "income_continuing_operations"), get_var(row, income_map, "net_extraordinary_gains_loss"), get_var(row, income_map, "net_income"), get_var(row, income_map, "net_income_common"))
+        income_tuple = (ticker, None, get_var(row, income_map, "currency"), None, fiscal_period, report_date, None, None, get_var(row, income_map, "shares_basic", balance_new.iloc[index]), None, get_var(row, income_map, "revenue"), get_var(row, income_map, "cost_of_revenue"), get_var(row, income_map, "gross_profit"), get_var(row, income_map, "operating_expenses"), get_var(row, income_map, "selling_general_admin"), get_var(row, income_map, "research_and_development"), None, get_var(row, income_map, "operating_income_loss"), get_var(row, income_map, "non_operating_income_loss"), get_var(row, income_map, "interest_expense_net"), None, None, get_var(row, income_map, "pretax_income_loss"), get_var(row, income_map, "income_tax_benefit_net"), get_var(row, income_map, "income_continuing_operations"), get_var(row, income_map, "net_extraordinary_gains_loss"), get_var(row, income_map, "net_income"), get_var(row, income_map, "net_income_common"))
         print("NEW INCOME STATEMENT VALS TO BE ADDED:")
         print(income_tuple)
         print(len(income_tuple))
-        query = f"""INSERT INTO f_income_stmts_annual
+        query = f"""INSERT INTO {tables["income"]}
                     VALUES %s"""
         cursor.execute(query, (income_tuple,))
+        db.bump_table_version(cursor, tables["income"])
         conn.commit()
 
     # Next deal with the balance sheet, do the same as above
     for index, row in balance_new.iterrows():
         report_date = datetime.strptime(row[balance_map["report_date"]], '%Y-%m-%d').date()
-        balance_tuple = (ticker, None, get_var(row, balance_map, "currency"), None, "FY", report_date, None, None, get_var(row, balance_map, "cash_equiv_st_investmts"), get_var(row, balance_map, "accounts_notes_receivable"), get_var(row, balance_map, "inventories"), get_var(row, balance_map, "total_current_assets"), get_var(row, balance_map, "property_plant_equip_net"), get_var(row, balance_map, "long_term_invest_receivables"), get_var(row, balance_map, "other_long_term_assets"), get_var(row, balance_map, "total_noncurrent_assets"), get_var(row, balance_map, "total_assets"), get_var(row, balance_map, "payables_and_accruals"), get_var(row, balance_map, "short_term_debt"), get_var(row, balance_map, "total_current_liabilities"), get_var(row, balance_map, "long_term_debt"), get_var(row, balance_map, "total_noncurrent_liabilities"), get_var(row, balance_map, "total_liabilities"), get_var(row, balance_map, "share_cap_add_cap"), get_var(row, balance_map, "treasury_stock"), get_var(row, balance_map, "retained_earnings"), get_var(row, balance_map, "total_equity"), get_var(row, balance_map, "total_liabilities_and_equity"))
+        balance_tuple = (ticker, None, get_var(row, balance_map, "currency"), None, fiscal_period, report_date, None, None, get_var(row, balance_map, "cash_equiv_st_investmts"), get_var(row, balance_map, "accounts_notes_receivable"), get_var(row, balance_map, "inventories"), get_var(row, balance_map, "total_current_assets"), get_var(row, balance_map, "property_plant_equip_net"), get_var(row, balance_map, "long_term_invest_receivables"), get_var(row, balance_map, "other_long_term_assets"), get_var(row, balance_map, "total_noncurrent_assets"), get_var(row, balance_map, "total_assets"), get_var(row, balance_map, "payables_and_accruals"), get_var(row, balance_map, "short_term_debt"), get_var(row, balance_map, "total_current_liabilities"), get_var(row, balance_map, "long_term_debt"), get_var(row, balance_map, "total_noncurrent_liabilities"), get_var(row, balance_map, "total_liabilities"), get_var(row, balance_map, "share_cap_add_cap"), get_var(row, balance_map, "treasury_stock"), get_var(row, balance_map, "retained_earnings"), get_var(row, balance_map, "total_equity"), get_var(row, balance_map, "total_liabilities_and_equity"))
         print("NEW BALANCE STATEMENT VALS TO BE ADDED:")
         print(balance_tuple)
         print(len(balance_tuple))
-        query = f"""INSERT INTO f_balance_sheets_annual
+        query = f"""INSERT INTO {tables["balance"]}
                     VALUES %s"""
         cursor.execute(query, (balance_tuple,))
+        db.bump_table_version(cursor, tables["balance"])
         conn.commit()
 
     # Finally deal with the cash flow statement, same was as above
     for index, row in cash_new.iterrows():
         report_date = datetime.strptime(row[cash_map["report_date"]], '%Y-%m-%d').date()
-        cash_tuple = (ticker, None, get_var(row, cash_map, "currency"), None, "FY", report_date, None, None, get_var(row, cash_map, "net_income_starting_line"), get_var(row, cash_map, "depreciation_and_amortization"), None, None, get_var(row, cash_map, "change_accts_receivable"), get_var(row, cash_map, "change_inventories"), get_var(row, cash_map, "change_accts_payable"), None, get_var(row, cash_map, "net_cash_operating_activities"), get_var(row, cash_map, "change_fixed_assets_intangibles"), get_var(row, cash_map, "net_change_long_term_invest"), None, get_var(row, cash_map, "net_cash_investing_activities"), get_var(row, cash_map, "dividends_paid"), get_var(row, cash_map, "cash_from_repay_debt"), get_var(row, cash_map, "cash_from_repurchase_equity"), get_var(row, cash_map, "net_cash_financing_activities"), get_var(row, cash_map, "net_change_cash"))
+        cash_tuple = (ticker, None, get_var(row, cash_map, "currency"), None, fiscal_period, report_date, None, None, get_var(row, cash_map, "net_income_starting_line"), get_var(row, cash_map, "depreciation_and_amortization"), None, None, get_var(row, cash_map, "change_accts_receivable"), get_var(row, cash_map, "change_inventories"), get_var(row, cash_map, "change_accts_payable"), None, get_var(row, cash_map, "net_cash_operating_activities"), get_var(row, cash_map, "change_fixed_assets_intangibles"), get_var(row, cash_map, "net_change_long_term_invest"), None, get_var(row, cash_map, "net_cash_investing_activities"), get_var(row, cash_map, "dividends_paid"), get_var(row, cash_map, "cash_from_repay_debt"), get_var(row, cash_map, "cash_from_repurchase_equity"), get_var(row, cash_map, "net_cash_financing_activities"), get_var(row, cash_map, "net_change_cash"))
         print("NEW CASHFLOW STATEMENT VALS TO BE ADDED:")
         print(cash_tuple)
         print(len(cash_tuple))
-        query = f"""INSERT INTO f_cashflow_annual
+        query = f"""INSERT INTO {tables["cash"]}
                     VALUES %s"""
         cursor.execute(query, (cash_tuple,))
+        db.bump_table_version(cursor, tables["cash"])
         conn.commit()
     cursor.close()
         
@@ -319,6 +448,23 @@ def update():
         if stock_present is False:
             print(f"Sorry, STOCK: {STOCK} is not in our database yet.")
 
+    # Handle quarterly statement updates, then roll the new quarters into the TTM tables
+    if UPDATE == "quarterly" and STOCK is not None:
+        stock_present = check_for_stock(conn, STOCK)
+
+        if stock_present and ensure_quarterly_tables(conn) is None:
+            updated_financials = get_updated_financials(conn, STOCK, "quarterly")
+
+            if updated_financials is not None:
+                print(f"Retrieved {len(updated_financials['income_stmts'].index)} new quarter(s) of data for {STOCK}.")
+                add_financials_to_db(conn, STOCK, updated_financials, "quarterly")
+
+            # Also picks up quarters loaded by other means (e.g. a SimFin import)
+            ttm.update_ttm(conn, STOCK)
+
+        if stock_present is False:
+            print(f"Sorry, STOCK: {STOCK} is not in our database yet.")
+
 
 
 
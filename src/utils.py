@@ -1,4 +1,5 @@
 import pandas as pd
+import numpy as np
 
 def get_growth(current, previous, n_years):
     '''
@@ -78,3 +79,48 @@ def compound_growth_rates(df, column_names):
 
     return pd.DataFrame(result)
 
+
+def vector_growth(current, previous, n_years):
+    '''
+    Vectorized version of get_growth, takes numpy arrays or pandas series
+    of current values, previous values and number of years between them
+    Returns a numpy array of compound growth rates (in %), with the same
+    0 and inf conventions as get_growth
+    '''
+    current = np.asarray(current, dtype=np.float64)
+    previous = np.asarray(previous, dtype=np.float64)
+    n_years = np.asarray(n_years, dtype=np.float64)
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        base = np.round(current/previous, 5)
+        result = ((base**(1/n_years))-1) * 100.0
+
+    result = np.where((base < 0) | (previous == 0) | (n_years == 0), np.inf, result)
+    return np.where(current == previous, 0.0, result)
+
+
+def growth_by_ticker(df, col, name, periods=(1, 3, 5), ticker_col="ticker", date_col="report_date"):
+    '''
+    This function takes in a multi-ticker dataframe df, sorted by ticker and date
+    For every row, it calculates the compound growth rate of col over the last
+    1, 3, 5 (periods) and max rows of that ticker's history, like compound_growth_rates
+    Returns a df of columns [name_growth_1yr, ..., name_growth_max], aligned to df
+    Rows without enough history get NaN
+    '''
+    result = {}
+    values = df[col].groupby(df[ticker_col], sort=False)
+    years = pd.to_datetime(df[date_col]).dt.year
+    year_groups = years.groupby(df[ticker_col], sort=False)
+
+    for n in periods:
+        previous = values.shift(n)
+        n_years = years - year_groups.shift(n)
+        result[f"{name}_growth_{n}yr"] = vector_growth(df[col], previous, n_years)
+
+    # Max is measured from the first row we have for the ticker
+    first = values.transform('first')
+    n_years = years - year_groups.transform('first')
+    result[f"{name}_growth_max"] = vector_growth(df[col], first, n_years)
+
+    return pd.DataFrame(result, index=df.index)
+
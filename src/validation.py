@@ -0,0 +1,136 @@
+import pandas as pd
+import numpy as np
+
+# The growth calculations look back 1, 3 and 5 years from the latest report
+MIN_YEARS = 6
+BASE_ROWS_BACK = [0, 1, 3, 5]
+
+# Report date of each statement, NaN/None where the statement has no row for that date
+DATE_COLUMNS = {
+    "income": "income_date",
+    "balance": "balance_date",
+    "cash": "cash_date",
+}
+
+
+def _aligned(df):
+    '''
+    Returns a boolean series, True where every statement has the row, with the same report date
+    '''
+    dates = df[list(DATE_COLUMNS.values())]
+    return dates.notna().all(axis=1) & dates.eq(dates["income_date"], axis=0).all(axis=1)
+
+
+def _positive_checks(df, aligned, positive_columns, index):
+    '''
+    Returns a tuple of (checks, messages) dicts flagging the tickers in index with a
+    missing or non-positive value in one of positive_columns at a growth base row
+    '''
+    checks = {}
+    messages = {}
+
+    # Values used as the base (or latest value) of a growth rate must be positive
+    aligned_df = df[aligned]
+    groups = aligned_df.groupby("ticker", sort=False)
+    is_base = groups.cumcount(ascending=False).isin(BASE_ROWS_BACK) | (groups.cumcount() == 0)
+
+    for col in positive_columns:
+        bad = is_base & (aligned_df[col].isna() | (aligned_df[col] <= 0))
+        checks[col] = bad.groupby(aligned_df["ticker"], sort=False).any().reindex(index, fill_value=False)
+        messages[col] = f"missing or non-positive {col}"
+
+    return checks, messages
+
+
+def _split(df, checks, messages, index):
+    '''
+    Returns a tuple of (valid_df, rejects_df) for the given per-ticker checks
+    '''
+    checks_df = pd.DataFrame(checks, index=index).fillna(False).astype(bool)
+    rejected = checks_df.any(axis=1)
+
+    # Build the reason strings only for the rejected tickers
+    failed = checks_df[rejected]
+    reasons = pd.Series("", index=failed.index)
+    for col in failed.columns:
+        reasons = reasons + pd.Series(np.where(failed[col], messages[col] + "; ", ""), index=failed.index)
+
+    rejects_df = pd.DataFrame({
+        "ticker": failed.index,
+        "reasons": reasons.str.rstrip("; ").to_numpy(),
+    })
+
+    valid_df = df[~df["ticker"].map(rejected).astype(bool)].reset_index(drop=True)
+    return valid_df, rejects_df
+
+
+def validate_fundamentals(df, positive_columns=(), min_years=MIN_YEARS):
+    '''
+    This function runs cheap checks over a multi-ticker df of fundamentals, sorted
+    by ticker and report date, before any valuation work is done on it
+    The df needs ticker, the DATE_COLUMNS and any of the positive_columns
+    A ticker is rejected if it is missing a statement, has report dates that don't
+    line up across statements, has fewer than min_years aligned years, or has a
+    missing or non-positive value in one of positive_columns at a growth base row
+    Returns a tuple of (valid_df, rejects_df), where rejects_df has a row per
+    rejected ticker with the reasons it was rejected
+    '''
+    tickers = df["ticker"]
+    present = df[list(DATE_COLUMNS.values())].notna()
+    aligned = _aligned(df)
+
+    has_statement = present.groupby(tickers, sort=False).any()
+    n_misaligned = (~aligned).groupby(tickers, sort=False).sum()
+    n_years = aligned.groupby(tickers, sort=False).sum()
+
+    checks = {}
+    messages = {}
+    for statement, col in DATE_COLUMNS.items():
+        checks[col] = ~has_statement[col]
+        messages[col] = f"missing {statement} statement"
+
+    # Only count misalignment when every statement is there, otherwise the above says why
+    checks["misaligned"] = (n_misaligned > 0) & has_statement.all(axis=1)
+    messages["misaligned"] = "misaligned report dates across statements"
+
+    checks["history"] = n_years < min_years
+    messages["history"] = f"fewer than {min_years} years of history"
+
+    positive_checks, positive_messages = _positive_checks(df, aligned, positive_columns, has_statement.index)
+    checks.update(positive_checks)
+    messages.update(positive_messages)
+
+    return _split(df, checks, messages, has_statement.index)
+
+
+def validate_positive(df, positive_columns):
+    '''
+    This function only runs the positive value check of validate_fundamentals, for
+    a df that already passed the other checks, so each model can apply its own
+    positive_columns without re-running the shared ones
+    Returns a tuple of (valid_df, rejects_df), like validate_fundamentals
+    '''
+    index = pd.Index(df["ticker"].unique())
+    checks, messages = _positive_checks(df, _aligned(df), positive_columns, index)
+    return _split(df, checks, messages, index)
+
+
+def statements_frame(ticker, income_df, balance_df, cashflow_df):
+    '''
+    Puts the separate statement dfs built in main.start into the
+    layout validate_fundamentals expects, lining rows up by position
+    the same way start does
+    '''
+    return pd.concat([
+        pd.DataFrame({
+            "income_date": income_df["Date"],
+            "shares_basic": income_df["Shares"],
+        }),
+        pd.DataFrame({
+            "balance_date": balance_df["Balance Date"],
+            "total_equity": balance_df["Total Equity"],
+        }),
+        pd.DataFrame({
+            "cash_date": cashflow_df["Cash Date"],
+        }),
+    ], axis=1, sort=False).assign(ticker=ticker)